@@ -0,0 +1,118 @@
+"""
+Analytical blocking model of the nanogemm microkernel benchmarks, following
+"Analytical modeling is enough for High-Performance BLIS" (Low et al.).
+All functions work on scalars as well as on NumPy arrays of configurations,
+which are broadcast against each other.
+
+Only depends on NumPy, so the gem5 configs can use it, too.
+"""
+
+import numpy
+
+def cache_sets(size      :numpy.ndarray,
+               assoc     :numpy.ndarray,
+               cache_line:numpy.ndarray = 64):
+    """Number of sets of a cache of size bytes"""
+    return numpy.asarray(size)/assoc/cache_line
+
+def unroll_factor(mr       :numpy.ndarray,
+                  nr       :numpy.ndarray,
+                  max_vregs:int = 32):
+    """
+    Unroll factor of the k loop (from uarch_bench/gemmerator.py): the
+    smallest one rotating all B registers, with mr vectors of C per B
+    element and 2*mr vectors for A
+    """
+    mr = numpy.asarray(mr)
+    nr = numpy.asarray(nr)
+    b_regs = max_vregs-mr*nr-2*mr
+    unroll = numpy.lcm(b_regs,nr)//nr
+    unroll = numpy.where(3 > unroll, 4, unroll)
+    unroll = numpy.where(4 == unroll, 8, unroll)
+    unroll = numpy.where(6 == unroll, 12, unroll)
+    return unroll
+
+def kc_l1(mr_elem   :numpy.ndarray,
+          nr        :numpy.ndarray,
+          l1_sets   :numpy.ndarray,
+          l1_assoc  :numpy.ndarray,
+          cache_line:numpy.ndarray = 64,
+          data_size :numpy.ndarray = 8):
+    """
+    kc such that the B micro-panel stays in the L1 while A micro-panels
+    stream through it (equation 4). Returns (kc, ways used by A)
+    """
+    # We take at least 1 way
+    ca = numpy.maximum(1, numpy.floor((l1_assoc-1.0)/(1.0+nr/mr_elem)))
+    kc = numpy.floor((ca*l1_sets*cache_line)/(mr_elem*data_size))
+    return kc.astype(numpy.int64), ca.astype(numpy.int64)
+
+def mc_l2(mr_elem   :numpy.ndarray,
+          nr        :numpy.ndarray,
+          kc        :numpy.ndarray,
+          l2_sets   :numpy.ndarray,
+          l2_assoc  :numpy.ndarray,
+          cache_line:numpy.ndarray = 64,
+          data_size :numpy.ndarray = 8):
+    """
+    mc (a multiple of mr_elem) such that the mc x kc block of A fits the L2
+    ways not needed by the kc x nr micro-panel of B
+    """
+    way_bytes = l2_sets*cache_line
+    cb = numpy.ceil(nr*kc*data_size/way_bytes)
+    ca = numpy.maximum(0, l2_assoc-1-cb)
+    mc = numpy.floor(ca*way_bytes/(kc*data_size))
+    return (mc//mr_elem*mr_elem).astype(numpy.int64)
+
+def nc_l3(nr        :numpy.ndarray,
+          mc        :numpy.ndarray,
+          kc        :numpy.ndarray,
+          l3_sets   :numpy.ndarray,
+          l3_assoc  :numpy.ndarray,
+          cache_line:numpy.ndarray = 64,
+          data_size :numpy.ndarray = 8):
+    """
+    nc (a multiple of nr) such that the kc x nc block of B fits the L3 ways
+    not needed by the mc x kc block of A
+    """
+    way_bytes = l3_sets*cache_line
+    ca = numpy.ceil(mc*kc*data_size/way_bytes)
+    cb = numpy.maximum(0, l3_assoc-1-ca)
+    nc = numpy.floor(cb*way_bytes/(kc*data_size))
+    return (nc//nr*nr).astype(numpy.int64)
+
+def blocking(mr        :numpy.ndarray,
+             nr        :numpy.ndarray,
+             simd_width:numpy.ndarray,
+             l1_sets   :numpy.ndarray,
+             l1_assoc  :numpy.ndarray,
+             cache_line:numpy.ndarray = 64,
+             data_size :numpy.ndarray = 8,
+             max_vregs :int = 32,
+             l2_sets   :numpy.ndarray = None,
+             l2_assoc  :numpy.ndarray = None,
+             l3_sets   :numpy.ndarray = None,
+             l3_assoc  :numpy.ndarray = None):
+    """
+    Blocking of mr (in vectors of simd_width bits) x nr (in elements of
+    data_size bytes) microkernels. Returns a dict of arrays:
+    unroll, iterations (of the unrolled k loop the benchmark runs), kc,
+    ca (L1 ways used by A), mr_elem, valid (enough vector registers) and,
+    if the L2/L3 are given, mc and nc.
+    """
+    mr = numpy.asarray(mr)
+    nr = numpy.asarray(nr)
+    mr_elem = mr*numpy.asarray(simd_width)/(numpy.asarray(data_size)*8)
+    unroll = unroll_factor(mr, nr, max_vregs)
+    kc, ca = kc_l1(mr_elem, nr, l1_sets, l1_assoc, cache_line, data_size)
+    model = {"unroll" : unroll,
+             "iterations" : kc//unroll,
+             "kc" : kc,
+             "ca" : ca,
+             "mr_elem" : mr_elem,
+             "valid" : max_vregs > mr*nr+2*mr+1}
+    if l2_sets is not None:
+        model["mc"] = mc_l2(mr_elem, nr, kc, l2_sets, l2_assoc, cache_line, data_size)
+        if l3_sets is not None:
+            model["nc"] = nc_l3(nr, model["mc"], kc, l3_sets, l3_assoc, cache_line, data_size)
+    return model
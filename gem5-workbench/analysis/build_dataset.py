@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import pandas
+
+import sys
+MIN_PYTHON = (3, 9)
+if sys.version_info < MIN_PYTHON:
+    sys.exit("Python %s.%s or later is required.\n" % MIN_PYTHON)
+
+
+from .data_extraction import (dataset_catalog, dataset_constants, index_params,
+                              read_catalog, read_dataset_constants,
+                              read_statfile, read_dists, range_buckets, dist_frame,
+                              same_value, sweep_constants, worker_count)
+
+
+def output_name(statfile_path :os.PathLike,
+                basedir       :os.PathLike,
+                generation    :str):
+    # Unique per stat file and conversion, files listed in the current
+    # catalog are never overwritten
+    return os.path.relpath(statfile_path, basedir)[:-len(".h5")].replace(os.sep, "__")+f".{generation}.parquet"
+
+def convert_statfile(basedir        :os.PathLike,
+                     output         :os.PathLike,
+                     partition      :list[str],
+                     skip_constants :set[str],
+                     row_group_rows :int,
+                     generation     :str,
+                     statfile_path  :os.PathLike):
+    """
+    Write the rows of a stat file, including distribution buckets and
+    the constants of just this file, into one Parquet file per partition
+    of the dataset, named after the generation of the conversion. Returns
+    the catalog entries of the written files.
+    """
+    import pyarrow
+    import pyarrow.parquet
+
+    df = read_statfile(statfile_path, skip_constants)
+    if not any("::bucket" in c for c in df.columns):
+        # Range-labelled buckets of older files are already read, stores
+        # keep their buckets out of the values
+        dists = range_buckets(df) or read_dists(statfile_path)
+        if dists:
+            buckets = dist_frame(dists)
+            buckets.index = df.index
+            df = pandas.concat([df, buckets], axis=1)
+    missing = [p for p in partition if p not in df]
+    if missing:
+        raise RuntimeError(f"{statfile_path} has no partition columns {missing}")
+
+    stat = os.stat(statfile_path)
+    entries = []
+    for values, part_df in df.groupby(partition, sort=True):
+        part_dir = os.path.join(*[f"{k}={int(v)}" for k,v in zip(partition, values)])
+        path = os.path.join(part_dir, output_name(statfile_path, basedir, generation))
+        os.makedirs(os.path.join(output, part_dir), exist_ok=True)
+        pyarrow.parquet.write_table(pyarrow.Table.from_pandas(part_df, preserve_index=False),
+                                    os.path.join(output, path),
+                                    compression="zstd",
+                                    row_group_size=row_group_rows)
+        entry = {"path" : path,
+                 "source" : os.path.relpath(statfile_path, basedir),
+                 "source_mtime" : stat.st_mtime,
+                 "source_size" : stat.st_size,
+                 "rows" : len(part_df)}
+        for p in index_params:
+            if p in part_df:
+                entry[f"{p}_min"] = int(part_df[p].min())
+                entry[f"{p}_max"] = int(part_df[p].max())
+        entries.append(entry)
+    return entries
+
+def same_constants(constants       :dict[str,tuple],
+                   other_constants :dict[str,tuple]):
+    return constants.keys() == other_constants.keys() and \
+           all(same_value(v, other_constants[c][0]) and d == other_constants[c][1]
+               for c,(v,d) in constants.items())
+
+def write_atomic(path :os.PathLike, write):
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def main():
+    import functools
+    import importlib.util
+    import time
+    import tqdm
+    from multiprocessing.pool import Pool
+
+    parser = argparse.ArgumentParser(description="Convert the stat files of a campaign into a partitioned Parquet dataset with a catalog, which build_df reads with pruning and memory-mapped scans")
+    parser.add_argument("--basedir", metavar="basedir", help='Base directory where simulation results are stored', required=True)
+    parser.add_argument("--output", metavar="output", help='Directory of the dataset, stat files converted before are only converted again if they changed', required=True)
+    parser.add_argument("--partition", metavar="partition", nargs='+', help='Parameters to partition the dataset by (default: simd_width simd_count simd_lat)', default=["simd_width","simd_count","simd_lat"])
+    parser.add_argument("--row-group-rows", metavar="row_group_rows", type=int, help='Rows per Parquet row group, selections skip row groups by their statistics (default: 16384)', default=16384)
+    parser.add_argument("--rebuild", help='Convert all stat files, even unchanged ones', action='store_true', default=False)
+
+    args = parser.parse_args()
+
+    if importlib.util.find_spec("pyarrow") is None:
+        sys.exit("Writing a dataset requires pyarrow, see requirements.txt")
+
+    output = os.path.realpath(args.output)
+    statfile_list = []
+    for root, dirs, files in os.walk(args.basedir):
+        # The dataset may be inside basedir
+        dirs[:] = [d for d in dirs if os.path.realpath(os.path.join(root, d)) != output]
+        for name in files:
+            if name.endswith(".h5"):
+                statfile_list.append(os.path.join(root, name))
+    statfile_list.sort()
+    print(f"Found {len(statfile_list)} stat files in {args.basedir}")
+
+    # Columns constant over the whole campaign are stored once in the
+    # constants file instead of in every Parquet file
+    constants = sweep_constants(statfile_list)
+    constants_json = {c : [float(v), d] for c,(v,d) in constants.items()}
+
+    os.makedirs(output, exist_ok=True)
+    catalog_path = os.path.join(output, dataset_catalog)
+    constants_path = os.path.join(output, dataset_constants)
+    constants_changed = not (os.path.exists(constants_path) and
+                             same_constants(read_dataset_constants(output),
+                                            {c : tuple(vd) for c,vd in constants_json.items()}))
+    catalog = pandas.DataFrame()
+    stale = pandas.DataFrame({"path" : []})
+    if os.path.exists(catalog_path):
+        catalog = read_catalog(output)
+        if args.rebuild or constants_changed:
+            print("Converting all stat files")
+            stale = catalog
+            catalog = pandas.DataFrame()
+        else:
+            current = {os.path.relpath(p, args.basedir) : os.stat(p) for p in statfile_list}
+            unchanged = {s for s,mtime,size in zip(catalog["source"],
+                                                   catalog["source_mtime"],
+                                                   catalog["source_size"])
+                         if s in current and (current[s].st_mtime, current[s].st_size) == (mtime, size)}
+            stale = catalog[~catalog["source"].isin(unchanged)]
+            catalog = catalog[catalog["source"].isin(unchanged)]
+            statfile_list = [p for p in statfile_list
+                             if os.path.relpath(p, args.basedir) not in unchanged]
+    print(f"Converting {len(statfile_list)} stat files")
+
+    entries = []
+    with Pool(worker_count(statfile_list)) as pool:
+        for file_entries in tqdm.tqdm(
+                pool.imap_unordered(
+                    functools.partial(convert_statfile,
+                                      args.basedir,
+                                      output,
+                                      args.partition,
+                                      set(constants),
+                                      args.row_group_rows,
+                                      f"{time.time_ns():x}"),
+                    statfile_list),
+                unit='files',
+                desc='Converting: ',
+                total=len(statfile_list),
+                delay=1,
+                smoothing=0.1,
+                ):
+            entries.extend(file_entries)
+
+    # The new files have names no catalog listed before, readers only
+    # see them once the catalog is replaced. A dataset with a catalog is
+    # complete
+    catalog = pandas.concat([catalog, pandas.DataFrame(entries)], ignore_index=True)
+    catalog = catalog.sort_values("path").reset_index(drop=True)
+    if constants_changed:
+        # The files of the old catalog don't fit the new constants, the
+        # dataset is incomplete until the new catalog is written
+        if os.path.exists(catalog_path):
+            os.remove(catalog_path)
+        def write_constants(path):
+            with open(path, "w") as constants_file:
+                json.dump(constants_json, constants_file, indent=1)
+        write_atomic(constants_path, write_constants)
+    write_atomic(catalog_path, lambda path: catalog.to_csv(path, index=False))
+    # Only listed in the old catalog
+    for path in stale["path"]:
+        try:
+            os.remove(os.path.join(output, path))
+        except FileNotFoundError:
+            pass
+    print(f"Dataset of {len(catalog)} files, {catalog['rows'].sum() if len(catalog) else 0} rows written to {output}")
+
+
+if "__main__" == __name__:
+    main()
@@ -19,19 +19,312 @@ index_params = ["mr","nr",
                 "fetch_buf_size",
                 "run"]
 
-def extract_target(select_stats  :dict[str,int],
-                   target_stats  :Union[str,list[str]],
-                   statfile_path :os.PathLike):
+# Stats extract_target derives the efficiency from
+efficiency_inputs = ["system.cpu.commitStats0.committedInstType::SimdFloatMultAcc",
+                     "system.cpu.commitStats0.committedInstType::SimdFloatMult",
+                     "system.cpu.numCycles",
+                     "simd_count"]
+
+def read_constants(statfile_path :os.PathLike):
+    """
+    Manifest of the columns that are constant over a whole stat file and
+    therefore not stored per row, as {column: (value, dtype)}
+    """
+    import tables
+    with tables.open_file(statfile_path, mode="r") as h5file:
+        if "/gem5stats/constant_columns" not in h5file:
+            return {}
+        group = h5file.root.gem5stats
+        return {c.decode() : (v, d.decode())
+                for c,v,d in zip(group.constant_columns.read(),
+                                 group.constant_values.read(),
+                                 group.constant_dtypes.read())}
+
+def select_rows(group         :"tables.Group",
+                select_stats  :Union[None,dict[str,int]] = None):
+    """
+    Rows of the appendable store in group matching all column == value
+    pairs of select_stats, as sorted row numbers (None for all rows).
+    Parameters are looked up in the indexed /gem5stats/params table, other
+    stored columns are read on their own, constant columns are compared
+    with the manifest. Columns that aren't stored don't select anything.
+    """
+    import numpy
+    if not select_stats:
+        return None
+    row_count = group.values.nrows
+    mask = numpy.ones(row_count, dtype=bool)
+    remaining = dict(select_stats)
+
+    if "params" in group:
+        indexed = {k : v for k,v in remaining.items() if k in group.params.colnames}
+        if indexed:
+            condition = " & ".join(f"({k} == v{i})" for i,k in enumerate(indexed))
+            condvars = {f"v{i}" : numpy.int64(v) for i,v in enumerate(indexed.values())}
+            indexed_mask = numpy.zeros(row_count, dtype=bool)
+            indexed_mask[group.params.get_where_list(condition, condvars=condvars)] = True
+            mask &= indexed_mask
+            remaining = {k : v for k,v in remaining.items() if k not in indexed}
+
+    if remaining:
+        columns = [c.decode() for c in group.columns.read()]
+        constants = {}
+        if "constant_columns" in group:
+            constants = dict(zip([c.decode() for c in group.constant_columns.read()],
+                                 group.constant_values.read()))
+        for key,value in remaining.items():
+            if key in constants:
+                if constants[key] != value:
+                    mask[:] = False
+            elif key in columns:
+                mask &= group.values[:,columns.index(key)] == value
+    return numpy.flatnonzero(mask)
+
+def index_runs(idx :"numpy.ndarray"):
+    """Sorted indices as (start, end) slices of consecutive indices"""
+    import numpy
+    breaks = numpy.flatnonzero(numpy.diff(idx) != 1)+1
+    starts = idx[numpy.concatenate([[0], breaks])]
+    ends = idx[numpy.concatenate([breaks-1, [len(idx)-1]])]+1
+    return list(zip(starts, ends))
+
+def read_rows(array       :"tables.Array",
+              rows        :Union[None,"numpy.ndarray"] = None,
+              column_idx  :Union[None,"numpy.ndarray"] = None):
+    """
+    The given rows and columns (sorted indices, all by default) of an
+    on-disk array. Consecutive rows and columns are read as one slice, so
+    only the chunks containing them are decompressed.
+    """
+    import numpy
+    row_count = array.nrows if rows is None else len(rows)
+    column_count = array.shape[1] if column_idx is None else len(column_idx)
+    if 0 == row_count or 0 == column_count:
+        return numpy.empty((row_count, column_count), dtype=array.dtype)
+    row_runs = [(0, row_count)] if rows is None else index_runs(rows)
+    column_runs = [(0, column_count)] if column_idx is None else index_runs(column_idx)
+    return numpy.concatenate(
+            [numpy.concatenate([array[row_start:row_end,column_start:column_end]
+                                for column_start,column_end in column_runs], axis=1)
+             for row_start,row_end in row_runs])
+
+def typed_frame(values  :"numpy.ndarray",
+                columns :list[str],
+                dtypes  :list[str]):
+    """
+    DataFrame of the float64 values with the given column dtypes. Columns
+    of a dtype are cast as one block, casting column by column is slow
+    for thousands of columns.
+    """
+    import numpy
+    dtypes = numpy.array(dtypes)
+    blocks = []
+    for dtype in dict.fromkeys(dtypes):
+        idx = numpy.flatnonzero(dtypes == dtype)
+        blocks.append(pandas.DataFrame(values[:,idx].astype(dtype, copy=False),
+                                       columns=[columns[i] for i in idx],
+                                       copy=False))
+    df = pandas.concat(blocks, axis=1) if len(blocks) > 1 else blocks[0]
+    if list(df.columns) != list(columns):
+        df = df[columns]
+    return df
+
+def read_statfile(statfile_path     :os.PathLike,
+                  skip_constants    :Union[set[str],list[str]] = (),
+                  select_stats      :Union[None,dict[str,int]] = None,
+                  columns           :Union[None,list[str]] = None):
+    """
+    Read a stat file written by multi-isa-nanogemm.py: either an appendable
+    store (/gem5stats/values with the names in /gem5stats/columns and
+    dtypes in /gem5stats/dtypes) or a DataFrame written with to_hdf.
+    Distribution buckets of appendable stores are not included, they are
+    loaded on demand with read_dists/expand_dists. Columns from the
+    manifest of constant columns are restored, except skip_constants.
+    Only the rows matching select_stats (column: value) are read from
+    appendable stores, see select_rows, and only the given columns (all by
+    default). Columns the file doesn't have are left out.
+    """
+    import numpy
+    import tables
+    with tables.open_file(statfile_path, mode="r") as h5file:
+        if "/gem5stats/values" in h5file:
+            group = h5file.root.gem5stats
+            stored = [c.decode() for c in group.columns.read()]
+            dtypes = [d.decode() for d in group.dtypes.read()]
+            column_idx = None
+            if columns is not None:
+                wanted = set(columns)
+                column_idx = numpy.array([i for i,c in enumerate(stored) if c in wanted],
+                                         dtype=numpy.int64)
+                stored = [stored[i] for i in column_idx]
+                dtypes = [dtypes[i] for i in column_idx]
+            rows = select_rows(group, select_stats)
+            df = typed_frame(read_rows(group.values, rows, column_idx), stored, dtypes)
+        else:
+            df = pandas.read_hdf(statfile_path, key="gem5stats")
+            selector = " & ".join([f"`{key}` == {value}" for key,value in (select_stats or {}).items()])
+            if selector:
+                df = df.query(selector)
+            if columns is not None:
+                df = df[[c for c in df.columns if c in set(columns)]]
+            return df
+    constants = {c : numpy.full(len(df), v, dtype=d)
+                 for c,(v,d) in read_constants(statfile_path).items()
+                 if c not in skip_constants and (columns is None or c in columns)}
+    if constants:
+        df = pandas.concat([df, pandas.DataFrame(constants)], axis=1)
+    return df
+
+def read_dists(statfile_path :os.PathLike,
+               names         :Union[None,list[str]] = None,
+               select_stats  :Union[None,dict[str,int]] = None):
+    """
+    Bucket counts of the distributions (all of them by default) as
+    {name: (row x bucket) array}, rows in the order of read_statfile with
+    the same select_stats.
+    Bucket i of a row counts the samples in
+    [name::min_value+i*name::bucket_size, name::min_value+(i+1)*name::bucket_size).
+    """
+    import numpy
+    import re
+    import tables
+    with tables.open_file(statfile_path, mode="r") as h5file:
+        if "/gem5stats/values" in h5file:
+            group = h5file.root.gem5stats
+            if "dists" not in group:
+                return {}
+            dist_names = [n.decode() for n in group.dist_names.read()]
+            offsets = group.dist_offsets.read()
+            if names is None:
+                names = dist_names
+            rows = select_rows(group, select_stats)
+            dists = {}
+            for name in names:
+                i = dist_names.index(name)
+                # Contiguous columns, only this distribution is read
+                dists[name] = read_rows(group.dists, rows,
+                                        numpy.arange(offsets[i], offsets[i+1]))
+            return dists
+    # Written with to_hdf, buckets are columns name::bucket<i> or, by
+    # older versions, labelled by their range
+    df = pandas.read_hdf(statfile_path, key="gem5stats")
+    selector = " & ".join([f"`{key}` == {value}" for key,value in (select_stats or {}).items()])
+    if selector:
+        df = df.query(selector)
+    buckets = {}
+    for column in df.columns:
+        match = re.fullmatch(r"(.*)::bucket(\d+)", column)
+        if match and (names is None or match.group(1) in names):
+            buckets.setdefault(match.group(1), []).append((int(match.group(2)), column))
+    dists = {name : df[[c for _,c in sorted(columns)]].to_numpy()
+             for name,columns in buckets.items()}
+    for name,buckets in range_buckets(df, names).items():
+        dists.setdefault(name, buckets)
+    return dists
+
+def range_buckets(df    :pandas.DataFrame,
+                  names :Union[None,list[str]] = None):
+    """
+    Distributions (all of them by default) of stat files written before
+    buckets were stored by position, as {name: (row x bucket) array} like
+    read_dists. Their bucket columns are labelled by range,
+    name::<start>-<end> or name::<start> for buckets of size 1, and hold 0
+    in rows whose buckets have other ranges. Bucket i of a row is the one
+    starting at name::min_value+i*size.
+    """
+    import numpy
+    import re
+    labelled = {}
+    for column in df.columns:
+        match = re.fullmatch(r"(.*)::(-?\d+(?:\.\d+)?)(?:-(-?\d+(?:\.\d+)?))?", column)
+        # Only distributions have a min_value, vectors can have numeric subnames
+        if match is None or f"{match.group(1)}::min_value" not in df:
+            continue
+        if names is not None and match.group(1) not in names:
+            continue
+        start = float(match.group(2))
+        end = start if match.group(3) is None else float(match.group(3))
+        labelled.setdefault(match.group(1), []).append((start, end-start+1, column))
+
+    dists = {}
+    for name,labels in labelled.items():
+        starts, sizes, columns = zip(*labels)
+        values = df[list(columns)].fillna(0).to_numpy()
+        min_values = df[f"{name}::min_value"].to_numpy(dtype=numpy.float64)
+        position = (numpy.array(starts)[None,:]-min_values[:,None])/numpy.array(sizes)[None,:]
+        index = numpy.rint(position)
+        # Labels of buckets with another size or start than the row's
+        # don't fall on a bucket of the row
+        valid = (numpy.abs(position-index) < 1e-6) & (index >= 0)
+        count = int(index[valid].max())+1 if valid.any() else 0
+        buckets = numpy.zeros((len(df), count), dtype=values.dtype)
+        rows, labels_idx = numpy.nonzero(valid & (values != 0))
+        buckets[rows, index[rows,labels_idx].astype(numpy.int64)] = values[rows,labels_idx]
+        dists[name] = buckets
+    return dists
+
+def expand_dists(statfile_path :os.PathLike,
+                 names         :Union[None,list[str]] = None,
+                 select_stats  :Union[None,dict[str,int]] = None):
+    """
+    Distributions as name::bucket<i> columns, rows in the order of
+    read_statfile with the same select_stats
+    """
+    return dist_frame(read_dists(statfile_path, names, select_stats))
+
+def dist_frame(dists :dict[str,"numpy.ndarray"]):
+    """Distributions as returned by read_dists as name::bucket<i> columns"""
+    return pandas.concat(
+            [pandas.DataFrame(buckets,
+                              columns=[f"{name}::bucket{i}" for i in range(buckets.shape[1])])
+             for name,buckets in dists.items()],
+            axis=1)
+
+def target_columns(select_stats :dict[str,int],
+                   target_stats :Union[str,list[str]]):
+    """
+    Stored columns extract_target needs for target_stats, None for all.
+    Derived columns (efficiency) are replaced by their inputs.
+    """
+    if isinstance(target_stats,str):
+        return None
+    return list(dict.fromkeys(index_params+efficiency_inputs+list(select_stats)+
+                              [t for t in target_stats if "::bucket" not in t]))
+
+def extract_target(select_stats   :dict[str,int],
+                   target_stats   :Union[str,list[str]],
+                   statfile_path  :os.PathLike,
+                   skip_constants :Union[set[str],list[str]] = ()):
     try:
-        df = pandas.read_hdf(statfile_path, key="gem5stats")
+        df = read_statfile(statfile_path, skip_constants, select_stats,
+                           columns=target_columns(select_stats, target_stats))
     except Exception as exc:
         print(f"error occured: {exc}")
 
+    if not isinstance(target_stats,str):
+        missing_buckets = [t for t in target_stats if "::bucket" in t and t not in df]
+        if missing_buckets:
+            dist_df = expand_dists(statfile_path,
+                                   names=list({t.split("::bucket")[0] for t in missing_buckets}),
+                                   select_stats=select_stats)
+            dist_df.index = df.index
+            df = pandas.concat([df, dist_df[missing_buckets]], axis=1)
+
+    return derive_targets(df, select_stats, target_stats)
+
+def derive_targets(df           :pandas.DataFrame,
+                   select_stats :dict[str,int],
+                   target_stats :Union[str,list[str]]):
+    """
+    Add the derived columns to the stats read for extract_target, apply
+    the selection and return the target_stats
+    """
     df["minCyclesPossible"] = (df["system.cpu.commitStats0.committedInstType::SimdFloatMultAcc"] +\
             df["system.cpu.commitStats0.committedInstType::SimdFloatMult"])/df["simd_count"]
     df["efficiency"] = df["minCyclesPossible"]/df["system.cpu.numCycles"]
 
-    selector = " & ".join([f"{key} == {value}" for key,value in select_stats.items()])
+    # Already applied while reading, except for columns that aren't stored
+    selector = " & ".join([f"`{key}` == {value}" for key,value in select_stats.items()])
     if selector:
         df = df.query(selector)
     if isinstance(target_stats,str):
@@ -42,46 +335,295 @@ def extract_target(select_stats  :dict[str,int],
     else:
         return df[index_params+target_stats]
 
+def same_value(a, b):
+    # Constants can be NaN, i.e. stats that are never sampled, which isn't
+    # equal to itself
+    return a == b or (a != a and b != b)
+
+def sweep_constants(statfile_list :list[os.PathLike]):
+    """
+    Columns with the same constant value in the manifests of all the stat
+    files, as {column: (value, dtype)}
+    """
+    constants = None
+    for statfile_path in statfile_list:
+        file_constants = read_constants(statfile_path)
+        if constants is None:
+            constants = file_constants
+        else:
+            constants = {c : vd for c,vd in constants.items()
+                         if c in file_constants and same_value(file_constants[c][0], vd[0])}
+        if not constants:
+            return {}
+    return constants or {}
+
+def read_bytes(statfile_path :os.PathLike,
+               columns       :Union[None,list[str]] = None):
+    """
+    Upper bound of the memory read_statfile needs for the given columns
+    (all by default) of a stat file, without reading it
+    """
+    import tables
+    with tables.open_file(statfile_path, mode="r") as h5file:
+        if "/gem5stats/values" in h5file:
+            group = h5file.root.gem5stats
+            column_count = group.values.shape[1]
+            if "constant_columns" in group:
+                column_count += group.constant_columns.nrows
+            if "dists" in group and columns is None:
+                column_count += group.dists.shape[1]
+            if columns is not None:
+                column_count = min(column_count, len(columns))
+            return group.values.nrows*column_count*8
+    # Written with to_hdf, compressed about 4:1
+    return 4*os.path.getsize(statfile_path)
+
+def describe_statfile(statfile_path :os.PathLike,
+                      select_stats  :Union[None,dict[str,int]] = None):
+    """
+    Upper bound of the rows read_statfile returns for select_stats and
+    {column: dtype} of everything extract_target can return for an
+    appendable store, from its metadata. None for files written with
+    to_hdf.
+    """
+    import tables
+    with tables.open_file(statfile_path, mode="r") as h5file:
+        if "/gem5stats/values" not in h5file:
+            return None
+        group = h5file.root.gem5stats
+        rows = select_rows(group, select_stats)
+        dtypes = dict(zip([c.decode() for c in group.columns.read()],
+                          [d.decode() for d in group.dtypes.read()]))
+        if "constant_columns" in group:
+            dtypes.update(zip([c.decode() for c in group.constant_columns.read()],
+                              [d.decode() for d in group.constant_dtypes.read()]))
+        if "dists" in group:
+            offsets = group.dist_offsets.read()
+            for name,first,last in zip(group.dist_names.read(), offsets[:-1], offsets[1:]):
+                dtypes.update({f"{name.decode()}::bucket{i}" : "uint32"
+                               for i in range(last-first)})
+        return {"rows" : group.values.nrows if rows is None else len(rows),
+                "dtypes" : dtypes}
+
+def frame_layout(descriptions   :list[dict],
+                 target_stats   :Union[str,list[str]],
+                 skip_constants :Union[set[str],list[str]] = ()):
+    """
+    Columns and dtypes of the frame build_df concatenates from the
+    extract_target results of the described files
+    """
+    dtypes = {}
+    for description in descriptions:
+        for column,dtype in description["dtypes"].items():
+            dtypes.setdefault(column, dtype)
+    derived = {"minCyclesPossible" : "float64", "efficiency" : "float64"}
+    if isinstance(target_stats,str):
+        columns = [c for c in dtypes if c not in skip_constants and "::bucket" not in c]
+        columns += list(derived)
+    else:
+        columns = list(dict.fromkeys(index_params+target_stats))
+    dtypes.update(derived)
+    return columns, [dtypes.get(c, "float64") for c in columns]
+
+def attach_shared_frame(blocks :list[tuple]):
+    # Pool initializer of build_df: the column blocks the workers write to
+    import numpy
+    extract_shared.blocks = [(numpy.frombuffer(raw, dtype=dtype).reshape(len(columns), -1),
+                              columns)
+                             for raw,dtype,columns in blocks]
+
+def extract_shared(select_stats   :dict[str,int],
+                   target_stats   :Union[str,list[str]],
+                   skip_constants :Union[set[str],list[str]],
+                   task           :tuple):
+    """
+    Worker of build_df: write the extract_target result of a stat file
+    into its rows [offset, offset+max_rows) of the shared column blocks
+    instead of returning it. Returns the number of rows written.
+    """
+    statfile_path, offset, max_rows = task
+    df = extract_target(select_stats, target_stats, statfile_path,
+                        skip_constants=skip_constants)
+    row_count = len(df)
+    if row_count > max_rows:
+        raise RuntimeError(f"{statfile_path} has {row_count} rows, expected at most {max_rows}")
+    for block,columns in extract_shared.blocks:
+        for i,column in enumerate(columns):
+            if column in df:
+                block[i,offset:offset+row_count] = df[column].to_numpy()
+    return statfile_path, row_count
+
+# Reductions build_df can apply in its workers
+reductions = ["argmax","argmin","mean"]
+
+def reduce_partial(df        :pandas.DataFrame,
+                   reduction :tuple[list[str],str,str]):
+    """
+    Partial result of reduction = (group keys, "argmax"|"argmin"|"mean",
+    target) for some of the rows. argmax/argmin keep the whole row with
+    the largest/smallest target of every group, mean keeps the sum and
+    count of the target. Partial results of several frames are combined
+    with reduce_merge.
+    """
+    keys, how, target = reduction
+    if "mean" == how:
+        partial = df.groupby(keys)[target].agg(["sum","count"]).reset_index()
+        return partial.rename(columns={"sum" : target, "count" : "reduce_count"})
+    # Positional labels, the index of older stat files repeats
+    df = df.dropna(subset=[target]).reset_index(drop=True)
+    grouped = df.groupby(keys, sort=False)[target]
+    idx = grouped.idxmax() if "argmax" == how else grouped.idxmin()
+    return df.loc[idx.values]
+
+def reduce_merge(partials  :list[pandas.DataFrame],
+                 reduction :tuple[list[str],str,str]):
+    """Combine partial results of reduce_partial into one"""
+    keys, how, target = reduction
+    df = pandas.concat(partials, ignore_index=True)
+    if "mean" == how:
+        return df.groupby(keys)[[target,"reduce_count"]].sum().reset_index()
+    return reduce_partial(df, reduction)
+
+def reduce_finish(df        :pandas.DataFrame,
+                  reduction :tuple[list[str],str,str]):
+    """Final result of the merged partial results"""
+    keys, how, target = reduction
+    if "mean" == how:
+        df[target] = df[target]/df.pop("reduce_count")
+    return df.reset_index(drop=True)
+
+def extract_reduced(select_stats   :dict[str,int],
+                    target_stats   :Union[str,list[str]],
+                    reduction      :tuple[list[str],str,str],
+                    statfile_path  :os.PathLike,
+                    skip_constants :Union[set[str],list[str]] = ()):
+    # Worker of build_df, only the partial result is sent to the parent
+    return reduce_partial(extract_target(select_stats, target_stats, statfile_path,
+                                         skip_constants=skip_constants),
+                          reduction)
+
+def needed_columns(select_stats :dict,
+                   target_stats :Union[str,list[str]],
+                   reduction    :Union[None,tuple[list[str],str,str]] = None):
+    """
+    Columns build_df can't leave out even if they are constant, checks
+    the reduction
+    """
+    needed = set(efficiency_inputs) | set(select_stats)
+    if not isinstance(target_stats,str):
+        needed |= set(target_stats)
+    if reduction is not None:
+        keys, how, target = reduction
+        if how not in reductions:
+            raise ValueError(f"Unknown reduction {how}, expected one of {reductions}")
+        if not isinstance(target_stats,str):
+            missing = [c for c in keys+[target] if c not in index_params+target_stats]
+            if missing:
+                raise ValueError(f"Reduction columns {missing} are not extracted")
+        needed |= set(keys) | {target}
+    return needed
+
+def worker_count(statfile_list :list[os.PathLike],
+                 columns       :Union[None,list[str]] = None):
+    """
+    Processes reading the given columns of the stat files that fit into
+    half of the memory, at most one per core and file
+    """
+    import psutil
+    ram_available = psutil.virtual_memory().total
+    hw_cores = int(os.cpu_count())
+    print(f"System has {hw_cores} hardware cores")
+    # Only the needed columns are read, a worker holds the frame it read,
+    # a copy for the derived columns and the pickled result
+    ram_per_worker = 3*max((read_bytes(statfile_path, columns) for statfile_path in statfile_list),
+                           default=1)
+    print(f"Reading a stat file needs up to {ram_per_worker/2**20:.0f} MiB")
+    hw_max_ram_cores = int((0.50*ram_available)/ram_per_worker)
+    print(f"System has enough memory for {hw_max_ram_cores} concurrent workers")
+    hw_cores = min(hw_cores, max(hw_max_ram_cores,1))
+    return max(1, min(hw_cores, len(statfile_list)))
+
 def build_df(directory: os.PathLike,
              select_stats: dict,
-             target_stats: Union[str,list[str]] = "all" ):
+             target_stats: Union[str,list[str]] = "all",
+             restore_constants: bool = False,
+             reduction: Union[None,tuple[list[str],str,str]] = None):
+    """
+    DataFrame of the target_stats in all stat files below directory.
+    Columns constant over the whole sweep are only listed in
+    df.attrs["constants"], unless restore_constants is set, which adds
+    them as sparse columns. Columns constant in just some of the files are
+    always restored.
+    With a reduction (group keys, "argmax"|"argmin"|"mean", target), i.e.
+    ([p for p in index_params if "run" != p], "argmax", "efficiency") for
+    the best run of every configuration, the workers reduce their files
+    and the result only contains the reduced rows (for mean: the keys and
+    the mean target). Keys and target must be extracted columns.
+    Without a reduction, and if all files are appendable stores, the
+    frame is preallocated in shared memory from the row counts and dtypes
+    in the file metadata, the workers write their rows into it and the
+    result wraps it without copies. Columns a file doesn't have are NaN
+    (0 for integer columns) in its rows.
+    A directory with a catalog.csv is a dataset written by
+    analysis.build_dataset and read with dataset_build_df instead.
+    """
     import tqdm
-    import multiprocessing as mp
     from multiprocessing.pool import Pool
-    import psutil
     import functools
 
+    if os.path.exists(os.path.join(directory, dataset_catalog)):
+        return dataset_build_df(directory, select_stats, target_stats,
+                                restore_constants, reduction)
 
     statfile_list = []
     for root, _, files in os.walk(directory, topdown=False):
+        # Partition directories (i.e. simd_width=512) not matching the
+        # selection are skipped without opening their files
+        partition = dict(d.split("=", 1) for d in os.path.relpath(root, directory).split(os.sep)
+                         if "=" in d)
+        if any(k in select_stats and str(select_stats[k]) != v for k,v in partition.items()):
+            continue
         for name in files:
             if name.endswith(".h5"):
                 statfile_list.append(os.path.join(root, name))
 
     statfile_count = len(statfile_list)
 
-    ram_available = psutil.virtual_memory().total
-    hw_cores = int(os.cpu_count())
-    print(f"System has {hw_cores} hardware cores")
-    ram_per_worker = 20000*2**20
-    hw_max_ram_cores = int((0.50*ram_available)/ram_per_worker)
-    print(f"System has enough memory for {hw_max_ram_cores} concurrent workers")
-    hw_cores = min(hw_cores, max(hw_max_ram_cores,1))
-    max_workers = min(hw_cores, statfile_count)
+    constants = sweep_constants(statfile_list)
+    needed = needed_columns(select_stats, target_stats, reduction)
+    skip_constants = {c for c in constants if c not in needed}
+
+    max_workers = worker_count(statfile_list, target_columns(select_stats, target_stats))
+
+    descriptions = None
+    if reduction is None:
+        descriptions = [describe_statfile(statfile_path, select_stats)
+                        for statfile_path in statfile_list]
+        if any(d is None for d in descriptions):
+            print("Not all stat files are appendable stores, extracting without shared memory")
+            descriptions = None
+    if descriptions is not None:
+        return shared_build_df(statfile_list, descriptions, select_stats, target_stats,
+                               skip_constants, constants, restore_constants, max_workers)
+
+    if reduction is None:
+        worker = functools.partial(extract_target,
+                                   select_stats,
+                                   target_stats,
+                                   skip_constants=skip_constants)
+    else:
+        worker = functools.partial(extract_reduced,
+                                   select_stats,
+                                   target_stats,
+                                   reduction,
+                                   skip_constants=skip_constants)
 
     stat_df = pandas.DataFrame()
     df_list = []
     df_merge_count = 100
     with Pool(max_workers) as pool:
         for result in tqdm.tqdm(
-                pool.imap_unordered(
-                    functools.partial(
-                        extract_target,
-                        select_stats,
-                        target_stats
-                        ),
-                        statfile_list
-                    ),
+                pool.imap_unordered(worker, statfile_list),
                 unit='files',
                 desc='Extracting data: ',
                 total=statfile_count,
@@ -94,11 +636,201 @@ def build_df(directory: os.PathLike,
                 df_list.append(result)
 
             if len(df_list) > df_merge_count:
-                stat_df = pandas.concat([stat_df]+df_list)
+                if reduction is None:
+                    stat_df = pandas.concat([stat_df]+df_list)
+                else:
+                    stat_df = reduce_merge([stat_df]+df_list, reduction)
                 df_list = []
 
     if df_list:
-        stat_df = pandas.concat([stat_df]+df_list)
+        if reduction is None:
+            stat_df = pandas.concat([stat_df]+df_list)
+        else:
+            stat_df = reduce_merge([stat_df]+df_list, reduction)
         df_list = []
+    if reduction is not None and not stat_df.empty:
+        stat_df = reduce_finish(stat_df, reduction)
+
+    return add_constants(stat_df, constants, skip_constants,
+                         restore_constants and isinstance(target_stats,str))
 
+def add_constants(stat_df          :pandas.DataFrame,
+                  constants        :dict,
+                  skip_constants   :set[str],
+                  restore          :bool):
+    import numpy
+    if restore:
+        # A single fill value per column, concatenating sparse columns with
+        # different fill values is unreliable
+        for c in sorted(skip_constants):
+            value, dtype = constants[c]
+            stat_df[c] = pandas.arrays.SparseArray(numpy.full(len(stat_df), value, dtype=dtype),
+                                                   fill_value=value)
+    stat_df.attrs["constants"] = {c : constants[c][0] for c in skip_constants}
     return stat_df
+
+def shared_build_df(statfile_list     :list[os.PathLike],
+                    descriptions      :list[dict],
+                    select_stats      :dict,
+                    target_stats      :Union[str,list[str]],
+                    skip_constants    :set[str],
+                    constants         :dict,
+                    restore_constants :bool,
+                    max_workers       :int):
+    """
+    build_df with the frame preallocated in shared memory: one column
+    block per dtype, which the workers fill and pandas wraps as is.
+    Combining the blocks and ordering the columns only avoids copies with
+    copy-on-write, the default from pandas 3 on.
+    """
+    import numpy
+    import tqdm
+    from multiprocessing.pool import Pool
+    from multiprocessing.sharedctypes import RawArray
+    import functools
+
+    columns, dtypes = frame_layout(descriptions, target_stats, skip_constants)
+    max_rows = [d["rows"] for d in descriptions]
+    offsets = numpy.concatenate([[0], numpy.cumsum(max_rows)]).astype(numpy.int64)
+    row_count = int(offsets[-1])
+
+    blocks = []
+    arrays = []
+    for dtype in dict.fromkeys(dtypes):
+        block_columns = [c for c,d in zip(columns, dtypes) if d == dtype]
+        raw = RawArray("b", max(1, row_count*len(block_columns))*numpy.dtype(dtype).itemsize)
+        array = numpy.frombuffer(raw, dtype=dtype)[:row_count*len(block_columns)]
+        array = array.reshape(len(block_columns), row_count)
+        if numpy.issubdtype(array.dtype, numpy.floating):
+            array[:] = numpy.nan
+        blocks.append((raw, dtype, block_columns))
+        arrays.append((array, block_columns))
+    print(f"Preallocated {row_count} rows x {len(columns)} columns "
+          f"({sum(a.nbytes for a,_ in arrays)/2**20:.0f} MiB) in shared memory")
+
+    written = numpy.zeros(len(statfile_list), dtype=numpy.int64)
+    file_index = {path : i for i,path in enumerate(statfile_list)}
+    with Pool(max_workers, initializer=attach_shared_frame, initargs=(blocks,)) as pool:
+        for statfile_path, file_rows in tqdm.tqdm(
+                pool.imap_unordered(
+                    functools.partial(extract_shared,
+                                      select_stats,
+                                      target_stats,
+                                      skip_constants),
+                    [(p, offsets[i], max_rows[i]) for i,p in enumerate(statfile_list)]),
+                unit='files',
+                desc='Extracting data: ',
+                total=len(statfile_list),
+                delay=1,
+                smoothing=0.1,
+                ):
+            written[file_index[statfile_path]] = file_rows
+
+    frames = [pandas.DataFrame(array.T, columns=block_columns, copy=False)
+              for array,block_columns in arrays]
+    stat_df = pandas.concat(frames, axis=1) if len(frames) > 1 else frames[0]
+    stat_df = stat_df[columns]
+    if (written < max_rows).any():
+        # Selections on columns that aren't stored filter in the workers,
+        # only then the rows are copied
+        stat_df = stat_df.iloc[numpy.concatenate(
+                [numpy.arange(offsets[i], offsets[i]+written[i]) for i in range(len(written))])]
+        stat_df = stat_df.reset_index(drop=True)
+    return add_constants(stat_df, constants, skip_constants,
+                         restore_constants and isinstance(target_stats,str))
+
+
+# Files of a dataset written by analysis.build_dataset, next to the
+# partition directories with the Parquet files
+dataset_catalog = "catalog.csv"
+dataset_constants = "constants.json"
+
+def read_catalog(dataset_dir :os.PathLike):
+    """
+    One row per Parquet file of a dataset: its path relative to
+    dataset_dir, the source stat file, the number of rows and the range
+    of every parameter as <param>_min and <param>_max
+    """
+    # The source mtimes are compared exactly, the default parser can be
+    # off in the last digit
+    return pandas.read_csv(os.path.join(dataset_dir, dataset_catalog),
+                           float_precision="round_trip")
+
+def prune_catalog(catalog      :pandas.DataFrame,
+                  select_stats :dict[str,int]):
+    """Files of the catalog that can contain rows matching select_stats"""
+    for key,value in select_stats.items():
+        if f"{key}_min" in catalog:
+            catalog = catalog[(catalog[f"{key}_min"] <= value) & (catalog[f"{key}_max"] >= value)]
+    return catalog
+
+def read_dataset_constants(dataset_dir :os.PathLike):
+    """Columns constant over the whole dataset as {column: (value, dtype)}"""
+    import json
+    with open(os.path.join(dataset_dir, dataset_constants)) as constants_file:
+        return {c : tuple(vd) for c,vd in json.load(constants_file).items()}
+
+def dataset_build_df(dataset_dir       :os.PathLike,
+                     select_stats      :dict,
+                     target_stats      :Union[str,list[str]] = "all",
+                     restore_constants :bool = False,
+                     reduction         :Union[None,tuple[list[str],str,str]] = None):
+    """
+    build_df for a dataset: files that can't match the selection are
+    pruned with the catalog, the remaining ones are scanned by pyarrow
+    (memory mapped, multithreaded) with the selection and the column
+    projection pushed down to the Parquet row groups
+    """
+    import numpy
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.fs
+    import pyarrow.parquet
+
+    catalog = prune_catalog(read_catalog(dataset_dir), select_stats)
+    constants = read_dataset_constants(dataset_dir)
+    if any(k in constants and constants[k][0] != v for k,v in select_stats.items()):
+        catalog = catalog.iloc[0:0]
+    needed = needed_columns(select_stats, target_stats, reduction)
+    skip_constants = {c for c in constants if c not in needed}
+    print(f"Reading {len(catalog)} files, {catalog['rows'].sum()} rows of {dataset_dir}")
+    if catalog.empty:
+        return add_constants(pandas.DataFrame(), constants, skip_constants, False)
+
+    paths = [os.path.join(dataset_dir, p) for p in catalog["path"]]
+    # Stat files of a campaign can have different columns, the dataset
+    # would otherwise only have those of the first file. Columns a file
+    # doesn't have are NaN in its rows, like build_df does.
+    schema = pyarrow.unify_schemas([pyarrow.parquet.read_schema(p) for p in paths],
+                                   promote_options="permissive")
+    dataset = pyarrow.dataset.dataset(paths,
+                                      schema=schema,
+                                      format="parquet",
+                                      filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True))
+    names = set(dataset.schema.names)
+    condition = None
+    for key,value in select_stats.items():
+        if key in names:
+            expression = pyarrow.dataset.field(key) == value
+            condition = expression if condition is None else condition & expression
+    columns = target_columns(select_stats, target_stats)
+    if columns is None:
+        # Buckets are ordinary columns in a dataset, but like build_df
+        # "all" only returns them if asked for by name
+        columns = [c for c in dataset.schema.names if "::bucket" not in c]
+    else:
+        columns = [c for c in columns+target_stats if c in names]
+        columns = list(dict.fromkeys(columns))
+    table = dataset.to_table(columns=columns, filter=condition)
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    del table
+
+    for c in constants:
+        if c in needed:
+            value, dtype = constants[c]
+            df[c] = numpy.full(len(df), value, dtype=dtype)
+    df = derive_targets(df, select_stats, target_stats)
+    if reduction is not None:
+        df = reduce_finish(reduce_partial(df, reduction), reduction)
+    return add_constants(df.reset_index(drop=True), constants, skip_constants,
+                         restore_constants and isinstance(target_stats,str))
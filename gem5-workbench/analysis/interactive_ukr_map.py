@@ -15,7 +15,7 @@ if sys.version_info < MIN_PYTHON:
     sys.exit("Python %s.%s or later is required.\n" % MIN_PYTHON)
 
 
-from .data_extraction import build_df
+from .data_extraction import build_df,index_params
 
 
 def main():
@@ -51,7 +51,17 @@ def main():
     args = parser.parse_args()
 
     #df = pandas.read_hdf(args.hdf5file,key='gem5stats')
-    df = build_df(args.stat_dir, args.target_stat)
+    # The heatmap shows the best efficiency, only the best run of every
+    # configuration is needed. The lineplot shows the mean and confidence
+    # interval over all runs.
+    reduction = None
+    if 'heatmap' == args.plot_type:
+        reduction = ([p for p in index_params if "run" != p],
+                     "argmax", "efficiency")
+    df = build_df(args.stat_dir,
+                  select_stats={},
+                  target_stats=list(dict.fromkeys([args.target_stat, "efficiency"])),
+                  reduction=reduction)
 
     # Now handled by the extract script
     #df["minCyclesPossible"] = (df["system.cpu.commitStats0.committedInstType::SimdFloatMultAcc"] +\
@@ -120,9 +120,12 @@ def main():
     
     args = parser.parse_args()
 
+    # Only the best run of every configuration is used below
     df = build_df(directory=args.stat_dir,
                   select_stats={},
-                  target_stats=[args.target_stat])
+                  target_stats=[args.target_stat],
+                  reduction=([p for p in index_params if p not in reduce_params],
+                             "argmax", args.target_stat))
 
     # filter out analysis stats
     variable_params = [s for s in index_params if s not in args.analysis_stat and s not in reduce_params]
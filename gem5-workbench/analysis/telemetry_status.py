@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import time
+
+import sys
+MIN_PYTHON = (3, 9)
+if sys.version_info < MIN_PYTHON:
+    sys.exit("Python %s.%s or later is required.\n" % MIN_PYTHON)
+
+
+def last_records(directory: os.PathLike):
+    """
+    Last telemetry record of every node, from the *telemetry*.jsonl files
+    multi-isa-nanogemm.py writes below directory
+    """
+    records = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if "telemetry" not in name or not name.endswith(".jsonl"):
+                continue
+            with open(os.path.join(root, name)) as telemetry_file:
+                for line in telemetry_file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Partially written last line
+                        continue
+                    node = record["node"]
+                    if node not in records or records[node]["time"] < record["time"]:
+                        records[node] = record
+    return records
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}:{rest//60:02d}:{rest%60:02d}"
+
+def campaign_status(records: dict, now: float, stall_intervals: float):
+    """
+    Per node status lines and a campaign summary. A node is stalled when
+    it didn't write a record for stall_intervals telemetry intervals.
+    """
+    lines = []
+    header = (f"{'node':<28} {'rank':>4} {'state':<9} {'age':>8} {'done':>7} {'fail':>5} "
+              f"{'sims/h':>8} {'run':>4} {'queues':>8} {'backlog':>8} {'mem free':>9} {'eta':>9}")
+    lines.append(header)
+    stalled = []
+    for node, record in sorted(records.items(), key=lambda nr: (nr[1]["node_rank"], nr[0])):
+        age = now-record["time"]
+        state = record["state"]
+        if state in ["running", "draining"] and age > stall_intervals*record["interval"]:
+            state = "STALLED"
+            stalled.append(node)
+        rate = record["recent_sims_per_hour"]
+        if rate is None:
+            rate = record["sims_per_hour"]
+        lines.append(f"{node:<28} {record['node_rank']:>4} {state:<9} {format_seconds(age):>8} "
+                     f"{record['completed']:>7} {record['failed']:>5} {rate:>8.1f} "
+                     f"{record['running']:>4} {max(record['result_queue_depths'], default=0):>8} "
+                     f"{max(record['dp_backlog_rows'], default=0):>8} "
+                     f"{record['memory_available']/2**30:>8.1f}G "
+                     f"{format_seconds(record['eta_seconds']):>9}")
+
+    running = [r for r in records.values() if "running" == r["state"]]
+    completed = sum(r["completed"] for r in records.values())
+    failed = sum(r["failed"] for r in records.values())
+    rate = sum(r["recent_sims_per_hour"] or r["sims_per_hour"] for r in running)
+    etas = [r["eta_seconds"] for r in running if r["eta_seconds"] is not None]
+    lines.append("")
+    lines.append(f"{len(records)} nodes, {len(running)} running, {len(stalled)} stalled")
+    lines.append(f"{completed} simulations completed, {failed} failed, {rate:.1f} sims/h")
+    lines.append(f"Campaign ETA (slowest node): {format_seconds(max(etas, default=None))}")
+    if stalled:
+        lines.append(f"Stalled: {', '.join(stalled)}")
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description="Combine the telemetry of all nodes of a sweep into a campaign status")
+    parser.add_argument("--dir", metavar="dir", help='Directory containing the *telemetry*.jsonl files (i.e. the base_out_dir of the sweep)', required=True)
+    parser.add_argument("--stall_intervals", metavar="stall_intervals", type=float, help='Report a node as stalled after this many telemetry intervals without a record', default=3.0)
+    parser.add_argument("--watch", metavar="watch", type=float, help='Print the status every this many seconds', default=None)
+    parser.add_argument("--json", help='Print the last record of every node as JSON instead', action='store_true', default=False)
+
+    args = parser.parse_args()
+
+    while True:
+        records = last_records(args.dir)
+        if args.json:
+            print(json.dumps(records, indent=1))
+        elif not records:
+            print(f"No telemetry found in {args.dir}")
+        else:
+            print("\n".join(campaign_status(records, time.time(), args.stall_intervals)))
+        if args.watch is None:
+            break
+        time.sleep(args.watch)
+        print()
+
+
+if "__main__" == __name__:
+    main()
@@ -4,6 +4,11 @@
 #SBATCH -A zam
 #SBATCH -p batch
 #SBATCH --time=06:00:00
+# SIGTERM 5 minutes before the time limit. Otherwise SLURM only sends it
+# at the limit and kills the job after KillWait (30s by default), before
+# the drain (--drain_seconds, 60s by default) and writing the buffered
+# results are done
+#SBATCH --signal=TERM@300
 
 nodes=($(scontrol show hostnames "$SLURM_JOB_NODELIST"))
 vlens=(128 256 512 1024)
@@ -0,0 +1,25 @@
+#!/bin/bash
+#SBATCH -N 36
+#SBATCH -n 36
+#SBATCH -A zam
+#SBATCH -p batch
+#SBATCH --time=06:00:00
+# SIGTERM 5 minutes before the time limit. Otherwise SLURM only sends it
+# at the limit and kills the job after KillWait (30s by default), before
+# the drain (--drain_seconds, 60s by default) and writing the buffered
+# results are done
+#SBATCH --signal=TERM@300
+
+# Same sweep as run_benchmarks_jusuf.sh, but instead of one fixed
+# vlen/vcnt/iq slice per node, all nodes share the campaign through
+# file leases in the work directory and take over each other's batches
+#
+# The campaign directory is fixed, so a resubmitted or requeued job
+# continues the campaign: it takes over expired leases and skips the
+# results already stored. Pass it as the first argument or in
+# CAMPAIGN_DIR to run another campaign:
+#   sbatch run_benchmarks_jusuf_leases.sh ${SCRATCH}/nassyr1/nanogemm-campaign2
+
+out_dir=${1:-${CAMPAIGN_DIR:-${SCRATCH}/nassyr1/nanogemm-campaign}}
+
+PYTHONPATH=bine-configs:${HOME}/.local/lib/python3.11/site-packages:$PYTHONPATH srun --cpu-bind=none build/ALL/gem5.opt --no-output-files configs/multi-isa-nanogemm.py --isa aarch64 --mr {1..8} --nr {1..30} --simd_lat 4 --simd_count 1 2 4 --simd_width 128 256 512 1024 --decode_width 8 --commit_width 8 --fetch_buf_size 64 --assoc 8 --l1_size 64 --ld_count 2 --st_count 2 --simd_phreg_count 48 52 56 60 64 68 72 76 80 84 88 92 96 104 112 120 128 --rob_size 16 18 20 22 24 26 28 32 36 40 44 48 52 56 60 64 128 --iq_size 8 10 12 14 16 18 20 22 24 28 32 36 --split_bytes 5000000000 --base_out_dir=${out_dir} --work_dir=${out_dir}/work --resume --quiet --stat_filename stats_
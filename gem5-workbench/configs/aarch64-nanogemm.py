@@ -38,10 +38,11 @@ from common.cores.arm.O3_ARM_Neoverse_N1 import O3_ARM_Neoverse_N1,O3_ARM_Neover
 import argparse
 import os
 import shutil
-import math
+import sys
 
-def lcm(a, b):
-    return abs(a*b) // math.gcd(a, b)
+# The blocking model is shared with multi-isa-nanogemm.py and the analysis scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from analysis import blis_model
 
 def setup_cpu(simd_lat:int, simd_count:int, simd_width:int,
               ld_count:int, st_count:int,
@@ -121,32 +122,15 @@ def setup_system(mr:int, nr:int, simd_width:int, cpu):
     system.workload = SEWorkload.init_compatible(binary)
 
 
-    # from uarch_bench/gemmerator.py
-    max_vregs = 32
-    vectors_in_mr = mr
-    avec_count = 2*vectors_in_mr
-    b_regs = (max_vregs-vectors_in_mr*nr-avec_count)
-    smallest_unroll = lcm(b_regs,nr)//nr
-    unroll_factor = smallest_unroll
-    if 3 > unroll_factor:
-        unroll_factor = 4
-    if 4 == unroll_factor:
-        unroll_factor = 8
-    if 6 == unroll_factor:
-        unroll_factor = 12
-    w_l1 = cpu.dcache.assoc
-    cl   = system.cache_line_size
-    nl   = cpu.dcache.size/w_l1/cl
-    # NOTE: DOUBLE_SPECIFIC!
-    data_size = 8
-    mr_elem = mr*simd_width/(data_size*8)
-    # We take at least 1 bank
-    ca=max(1,int(math.floor((w_l1-1.0)/(1.0+nr/mr_elem))))
-    print(f"ca: {ca}")
-    # Equation 4 from "Analytical modeling is enough for High-Performance BLIS"
-    kc=int((ca*nl*cl)/(mr_elem*data_size))
-    print(f"assoc: {w_l1}, cl:{cl}, nl:{nl}, mr_elem: {mr_elem}, nr: {nr} ===> kc: {kc}")
-    iterations=int(kc)//unroll_factor
+    w_l1 = int(cpu.dcache.assoc)
+    cl   = int(system.cache_line_size)
+    nl   = float(cpu.dcache.size/w_l1/cl)
+    model = blis_model.blocking(mr, nr, simd_width,
+                                l1_sets=nl, l1_assoc=w_l1, cache_line=cl)
+    unroll_factor = int(model["unroll"])
+    iterations = int(model["iterations"])
+    print(f"ca: {model['ca']}")
+    print(f"assoc: {w_l1}, cl:{cl}, nl:{nl}, mr_elem: {model['mr_elem']}, nr: {nr} ===> kc: {model['kc']}")
     print(f"unroll: {unroll_factor} ===> iterations: {iterations} ===> kc: {iterations*unroll_factor}")
 
     process = Process()
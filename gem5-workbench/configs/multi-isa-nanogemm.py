@@ -31,150 +31,256 @@ X86 ISA). More detailed documentation can be found in `simple.py`.
 
 
 import argparse
+import csv
 import itertools
 import os
 import psutil
 import math
-import concurrent.futures
-
-import pandas as pd
-
-
-def prepare_statdict(statmap):
+import queue
+import sys
+import time
+
+# The blocking model is shared with the analysis scripts, the stat store,
+# schedulers and result cache are modules of their own
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from analysis import blis_model
+from sweep.stat_store import (combo_params, partition_params, stored_params,
+                              meta_columns, partition_dir,
+                              create_stat_store, append_stat_store,
+                              compact_stat_store, append_completed_index,
+                              load_completed_combos)
+from sweep.schedulers import (SweepScheduler, PruningScheduler, FrontierSearch,
+                              LeaseScheduler, write_frontier)
+from sweep.result_cache import (file_digest, config_fingerprint,
+                                load_cached_result, store_cached_result)
+
+
+# Summary columns stored for every distribution, after its buckets
+dist_summary_columns = ["bucket_size",
+                        "min_value","max_value",
+                        "mean","stddev",
+                        "samples","total","overflows"]
+
+def stat_columns(statmap, stat_filter=None):
+    """
+    Ordered list of the columns the stats in statmap expand to.
+    Distribution buckets are stored by position (name::bucket0, ...)
+    together with name::min_value and name::bucket_size, because
+    histograms rescale their buckets during a simulation.
+    """
     import _m5.stats
-    statdict = {}
-    statdict["mr"] = []
-    statdict["nr"] = []
-    statdict["simd_lat"] = []
-    statdict["simd_count"] = []
-    statdict["simd_width"] = []
-    statdict["simd_phreg_count"] = []
-    statdict["ld_count"] = []
-    statdict["st_count"] = []
-    statdict["l1_size"] = []
-    statdict["iq_size"] = []
-    statdict["rob_size"] = []
-    statdict["assoc"] = []
-    statdict["decode_width"] = []
-    statdict["commit_width"] = []
-    statdict["fetch_buf_size"] = []
-    statdict["run"] = []
+    columns = []
     for name,stat in statmap.items():
         stat.prepare()
         if isinstance(stat,_m5.stats.FormulaInfo):
             if len(stat.subnames) > 1:
-                for sname in stat.subnames:
-                    if sname == "":
-                        continue
-                    statdict[f"{name}::{sname}"] = []
+                columns.extend(f"{name}::{sname}" for sname in stat.subnames if sname != "")
             else:
-                statdict[f"{name}"] = []
+                columns.append(f"{name}")
         elif isinstance(stat,_m5.stats.ScalarInfo):
-            statdict[f"{name}"] = []
+            columns.append(f"{name}")
         elif isinstance(stat, _m5.stats.DistInfo):
-            for i,v in enumerate(stat.values):
-                bucket_start = stat.min_val+i*stat.bucket_size
-                if bucket_start.is_integer():
-                    bucket_start = int(bucket_start)
-                bucket_end = stat.min_val+(i+1)*stat.bucket_size-1
-                if bucket_end.is_integer():
-                    bucket_end = int(bucket_end)
-                bucket = f"{bucket_start}-{bucket_end}"
-                if bucket_end == bucket_start:
-                    bucket = f"{bucket_start}"
-                statdict[f"{name}::{bucket}"] = []
-            statdict[f"{name}::min_value"] = []
-            statdict[f"{name}::max_value"] = []
-            statdict[f"{name}::mean"] = []
-            statdict[f"{name}::stddev"] = []
-            statdict[f"{name}::samples"] = []
-            statdict[f"{name}::total"] = []
-            statdict[f"{name}::overflows"] = []
+            columns.extend(f"{name}::bucket{i}" for i in range(len(stat.values)))
+            columns.extend(f"{name}::{summary}" for summary in dist_summary_columns)
         elif isinstance(stat, _m5.stats.VectorInfo):
-            for sname,sval in zip(stat.subnames,stat.value):
-                if sname == "":
-                    continue
-                statdict[f"{name}::{sname}"] = []
-    return statdict
+            columns.extend(f"{name}::{sname}" for sname in stat.subnames if sname != "")
+    return [c for c in columns if column_selected(stat_filter, c)]
 
 
-def append_stats(statmap, statdict):
+def compile_stat_layout(statmap, column_index : dict):
+    """
+    Map every stat in statmap to the schema columns it fills, so
+    fill_stat_row doesn't have to build column names per measurement.
+    Values without a schema column are dropped.
+    """
     import _m5.stats
-    import functools
+    layout = []
+    dropped = 0
+    def indices(names):
+        nonlocal dropped
+        idx = []
+        for n in names:
+            # Empty subnames (None) are never stored
+            i = column_index.get(n, -1) if n is not None else -1
+            if -1 == i and n is not None:
+                dropped = dropped + 1
+            idx.append(i)
+        return idx
     for name,stat in statmap.items():
         stat.prepare()
         if isinstance(stat,_m5.stats.FormulaInfo):
             if len(stat.subnames) > 1:
-                for sname,sval in zip(stat.subnames,stat.value):
-                    if sname == "":
-                        continue
-                    statdict[f"{name}::{sname}"].append(sval)
+                layout.append(("vector", stat,
+                               indices(f"{name}::{sname}" if sname != "" else None
+                                       for sname in stat.subnames)))
             else:
-                val = stat.result
-                statdict[f"{name}"].append(val[0])
+                layout.append(("formula", stat, indices([f"{name}"])))
         elif isinstance(stat,_m5.stats.ScalarInfo):
-            statdict[f"{name}"].append(stat.result)
+            layout.append(("scalar", stat, indices([f"{name}"])))
         elif isinstance(stat, _m5.stats.DistInfo):
-            for i,v in enumerate(stat.values):
-                bucket_start = stat.min_val+i*stat.bucket_size
-                if bucket_start.is_integer():
-                    bucket_start = int(bucket_start)
-                bucket_end = stat.min_val+(i+1)*stat.bucket_size-1
-                if bucket_end.is_integer():
-                    bucket_end = int(bucket_end)
-                bucket = f"{bucket_start}-{bucket_end}"
-                if bucket_end == bucket_start:
-                    bucket = f"{bucket_start}"
-                # Sometimes the bucket doesn't exist.
-                # In this case initialize the value list with as many
-                # zeroes as there are elements in the min_val list, as
-                # min_val should have been recorded every time
-                must_len = len(statdict[f"{name}::min_value"])
-                if f"{name}::{bucket}" not in statdict:
-                    statdict[f"{name}::{bucket}"] = [0]*must_len
-                # Also if the bucket exists, but the len is too small, 
-                # fill the missing values with zeroes
-                bucket_vlist_len = len(statdict[f"{name}::{bucket}"])
-                if must_len > bucket_vlist_len:
-                    statdict[f"{name}::{bucket}"].extend([0]*(must_len-bucket_vlist_len))
-                statdict[f"{name}::{bucket}"].append(v)
-            statdict[f"{name}::min_value"].append(stat.min_val)
-            statdict[f"{name}::max_value"].append(stat.max_val)
-            count = functools.reduce(lambda a,b : a+b, stat.values, 0)
-            statdict[f"{name}::mean"].append(stat.sum/max(1.0,count))
-            stddev = math.sqrt(
-                              max(0.0,(stat.squares*count - stat.sum*stat.sum))/
-                              max(1.0,(count*(count-1.0))))
-            statdict[f"{name}::stddev"].append(stddev)
-            statdict[f"{name}::samples"].append(count)
-            statdict[f"{name}::total"].append(stat.sum)
-            statdict[f"{name}::overflows"].append(stat.overflow)
+            bucket_idx = []
+            i = 0
+            while f"{name}::bucket{i}" in column_index:
+                bucket_idx.append(column_index[f"{name}::bucket{i}"])
+                i = i+1
+            layout.append(("dist", stat,
+                           bucket_idx,
+                           indices(f"{name}::{summary}" for summary in dist_summary_columns)))
         elif isinstance(stat, _m5.stats.VectorInfo):
-            for sname,sval in zip(stat.subnames,stat.value):
-                if sname == "":
-                    continue
-                statdict[f"{name}::{sname}"].append(sval)
+            layout.append(("vector", stat,
+                           indices(f"{name}::{sname}" if sname != "" else None
+                                   for sname in stat.subnames)))
         elif isinstance(stat, _m5.stats.Info):
             pass
             # I'm not sure what to do with a _m5.stats.Info object?
-            #print(f"{name}{stat.name}/unit = {stat.unit}")
-            #print(f"{name}{stat.name}/flags = {stat.flags}")
-            #print(f"{name}{stat.name}/desc = {stat.desc}")
         else:
             print("%s is a %s and has %s" %(f"{name}{stat.name}",type(stat),dir(stat)))
+    if dropped:
+        print(f"{dropped} stat values have no column in the schema and are dropped")
+    return layout
 
 
-def build_stat_tree(statmap : dict, name: str, groups):
+def fill_stat_row(layout, row):
+    for kind, stat, *idx in layout:
+        stat.prepare()
+        if "scalar" == kind:
+            if -1 != idx[0][0]:
+                row[idx[0][0]] = stat.result
+        elif "formula" == kind:
+            if -1 != idx[0][0]:
+                row[idx[0][0]] = stat.result[0]
+        elif "vector" == kind:
+            for i,sval in zip(idx[0],stat.value):
+                if -1 != i:
+                    row[i] = sval
+        elif "dist" == kind:
+            bucket_idx, summary_idx = idx
+            values = stat.values
+            if len(values) > len(bucket_idx):
+                # More buckets than the schema probe saw, keep the first ones
+                print(f"{stat.name}: {len(values)-len(bucket_idx)} buckets not in schema")
+            for i,v in zip(bucket_idx,values):
+                row[i] = v
+            count = sum(values)
+            stddev = math.sqrt(
+                              max(0.0,(stat.squares*count - stat.sum*stat.sum))/
+                              max(1.0,(count*(count-1.0))))
+            summaries = [stat.bucket_size,
+                         stat.min_val, stat.max_val,
+                         stat.sum/max(1.0,count), stddev,
+                         count, stat.sum, stat.overflow]
+            for i,v in zip(summary_idx,summaries):
+                if -1 != i:
+                    row[i] = v
+
+
+def compile_stat_filter(include : list, exclude : list):
+    """
+    Patterns are globs over stat paths (system.cpu.numCycles), or regular
+    expressions when prefixed with "re:". Patterns containing "::" select
+    single columns of vector/formula/distribution stats.
+    """
+    import fnmatch
+    import re
+    def compile_patterns(patterns):
+        compiled = []
+        for pattern in patterns or []:
+            if pattern.startswith("re:"):
+                compiled.append((pattern, None, re.compile(pattern[3:])))
+            else:
+                # Literal part of the glob, used to prune subtrees
+                prefix = re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+                compiled.append((pattern, prefix, re.compile(fnmatch.translate(pattern))))
+        return compiled
+    return {"include" : compile_patterns(include),
+            "exclude" : compile_patterns(exclude)}
+
+def _pattern_matches(compiled, path : str):
+    _, _, regex = compiled
+    return regex.fullmatch(path) is not None
+
+def _stat_part(compiled):
+    # Stat path part of a column pattern, or the whole pattern
+    pattern, prefix, regex = compiled
+    if prefix is not None and "::" in pattern:
+        import fnmatch
+        import re
+        stat_pattern = pattern.split("::")[0]
+        return (stat_pattern, prefix, re.compile(fnmatch.translate(stat_pattern)))
+    return compiled
+
+def subtree_selected(stat_filter, group_path : str):
+    if stat_filter is None:
+        return True
+    for compiled in stat_filter["exclude"]:
+        # "system.membus" and "system.membus.*" both skip the subtree
+        if _pattern_matches(compiled, group_path) or _pattern_matches(compiled, group_path+".*"):
+            return False
+    if not stat_filter["include"]:
+        return True
+    for pattern, prefix, regex in stat_filter["include"]:
+        # Regular expressions can't be checked against a subtree
+        if prefix is None:
+            return True
+        if prefix == group_path \
+                or prefix.startswith(group_path+".") \
+                or (group_path+".").startswith(prefix):
+            return True
+    return False
+
+def stat_selected(stat_filter, stat_path : str):
+    if stat_filter is None:
+        return True
+    if any(_pattern_matches(_stat_part(c), stat_path) for c in stat_filter["exclude"] if "::" not in c[0]):
+        return False
+    if not stat_filter["include"]:
+        return True
+    return any(_pattern_matches(_stat_part(c), stat_path) for c in stat_filter["include"])
+
+def column_selected(stat_filter, column : str):
+    if stat_filter is None:
+        return True
+    if any(_pattern_matches(c, column) for c in stat_filter["exclude"]):
+        return False
+    if not stat_filter["include"]:
+        return True
+    stat_path = column.split("::")[0]
+    for compiled in stat_filter["include"]:
+        if "::" in compiled[0]:
+            if _pattern_matches(compiled, column):
+                return True
+        elif _pattern_matches(compiled, stat_path):
+            return True
+    return False
+
+
+def build_stat_tree(statmap : dict, name: str, groups, stat_filter=None):
     for key in groups:
+        if not subtree_selected(stat_filter, f"{name}{key}"):
+            continue
         group = groups[key]
         subgroups = group.getStatGroups()
         if 0 != len(subgroups):
-            build_stat_tree(statmap, f"{name}{key}.", subgroups)
+            build_stat_tree(statmap, f"{name}{key}.", subgroups, stat_filter)
         stats = group.getStats()
-        statmap.update({f"{name}{key}.{stat.name}" : stat for stat in stats if f"{name}{stat.name}" not in statmap })
+        statmap.update({f"{name}{key}.{stat.name}" : stat for stat in stats
+                        if f"{name}{stat.name}" not in statmap
+                        and stat_selected(stat_filter, f"{name}{key}.{stat.name}")})
+
+def kernel_blocking(mr:int, nr:int, simd_width:int, w_l1, cl, nl, verbose=False):
+    """
+    Unroll factor and number of kernel iterations for an L1-sized kc
+    """
+    model = blis_model.blocking(mr, nr, simd_width,
+                                l1_sets=nl, l1_assoc=w_l1, cache_line=cl)
+    unroll_factor = int(model["unroll"])
+    iterations = int(model["iterations"])
+    if verbose:
+        print(f"ca: {model['ca']}")
+        print(f"assoc: {w_l1}, cl:{cl}, nl:{nl}, mr_elem: {model['mr_elem']}, nr: {nr} ===> kc: {model['kc']}")
+        print(f"unroll: {unroll_factor} ===> iterations: {iterations} ===> kc: {iterations*unroll_factor}")
+    return unroll_factor, iterations
 
-def lcm(a, b):
-    return abs(a*b) // math.gcd(a, b)
 
 def setup_cpu(isa:str,
               simd_lat:int, simd_count:int, 
@@ -240,7 +346,27 @@ def setup_cpu(isa:str,
 
     return cpu
 
-def setup_system(isa:str, mr:int, nr:int, simd_width:int, cpu):
+def benchmark_binary(isa:str, mr:int, nr:int):
+    thispath = os.path.dirname(os.path.realpath(__file__))
+    bin_name = ""
+    if "riscv64" == isa:
+        bin_name = f"gemmbench_{mr}_{nr}_avecpreload_bvecfmavf"
+    elif "aarch64" == isa:
+        bin_name = f"gemmbench_{mr}_{nr}_avecpreload_bvecdist1_boff"
+    else:
+        raise RuntimeError("Unknown isa {isa}")
+    return os.path.join(
+        thispath,
+        "../",
+        f"binaries/{isa}/{bin_name}",
+    )
+
+def setup_system(isa:str, mr:int, nr:int, simd_width:int, cpu, iterations=None):
+    """
+    SE system running the benchmark on cpu. Without iterations, cpu is a
+    detailed CPU with L1 caches the iterations are derived from, otherwise
+    an atomic CPU without caches (to create checkpoints)
+    """
     import m5
     from m5.objects import System, SrcClockDomain, VoltageDomain, AddrRange, SystemXBar, MemCtrl, DDR4_2400_8x8, SEWorkload, Process
 
@@ -252,7 +378,7 @@ def setup_system(isa:str, mr:int, nr:int, simd_width:int, cpu):
     system.clk_domain.clock = "1GHz"
     system.clk_domain.voltage_domain = VoltageDomain()
 
-    system.mem_mode = "timing"
+    system.mem_mode = "timing" if iterations is None else "atomic"
     system.mem_ranges = [AddrRange("256MiB")]
     #system.cpu = cpu
 
@@ -273,57 +399,26 @@ def setup_system(isa:str, mr:int, nr:int, simd_width:int, cpu):
     system.system_port = system.membus.cpu_side_ports
     system.cpu = cpu
 
-    system.cpu.icache.mem_side = system.membus.cpu_side_ports
-    system.cpu.dcache.mem_side = system.membus.cpu_side_ports
+    if iterations is None:
+        system.cpu.icache.mem_side = system.membus.cpu_side_ports
+        system.cpu.dcache.mem_side = system.membus.cpu_side_ports
+    else:
+        system.cpu.icache_port = system.membus.cpu_side_ports
+        system.cpu.dcache_port = system.membus.cpu_side_ports
 
     system.cpu.createInterruptController()
 
     #system.system_port = system.membus.cpu_side_ports
 
-    thispath = os.path.dirname(os.path.realpath(__file__))
-    bin_name = ""
-    if "riscv64" == isa:
-        bin_name = f"gemmbench_{mr}_{nr}_avecpreload_bvecfmavf"
-    elif "aarch64" == isa:
-        bin_name = f"gemmbench_{mr}_{nr}_avecpreload_bvecdist1_boff"
-    else:
-        raise RuntimeError("Unknown isa {isa}")
-    binary = os.path.join(
-        thispath,
-        "../",
-        f"binaries/{isa}/{bin_name}",
-    )
+    binary = benchmark_binary(isa, mr, nr)
 
     system.workload = SEWorkload.init_compatible(binary)
 
-    # from uarch_bench/gemmerator.py
-    max_vregs = 32
-    vectors_in_mr = mr
-    avec_count = 2*vectors_in_mr
-    b_regs = (max_vregs-vectors_in_mr*nr-avec_count)
-    smallest_unroll = lcm(b_regs,nr)//nr
-    unroll_factor = smallest_unroll
-    if 3 > unroll_factor:
-        unroll_factor = 4
-    if 4 == unroll_factor:
-        unroll_factor = 8
-    if 6 == unroll_factor:
-        unroll_factor = 12
-    w_l1 = cpu.dcache.assoc
-    cl   = system.cache_line_size
-    nl   = cpu.dcache.size/w_l1/cl
-    # NOTE: DOUBLE_SPECIFIC!
-    data_size = 8
-    mr_elem = mr*simd_width/(data_size*8)
-    # We take at least 1 bank
-    ca=max(1,int(math.floor((w_l1-1.0)/(1.0+nr/mr_elem))))
-
-    print(f"ca: {ca}")
-    # Equation 4 from "Analytical modeling is enough for High-Performance BLIS"
-    kc=int((ca*nl*cl)/(mr_elem*data_size))
-    print(f"assoc: {w_l1}, cl:{cl}, nl:{nl}, mr_elem: {mr_elem}, nr: {nr} ===> kc: {kc}")
-    iterations=int(kc)//unroll_factor
-    print(f"unroll: {unroll_factor} ===> iterations: {iterations} ===> kc: {iterations*unroll_factor}")
+    if iterations is None:
+        w_l1 = int(cpu.dcache.assoc)
+        cl   = int(system.cache_line_size)
+        nl   = float(cpu.dcache.size/w_l1/cl)
+        _, iterations = kernel_blocking(mr, nr, simd_width, w_l1, cl, nl, verbose=True)
 
     process = Process(output="/dev/null",errout="/dev/null")
     process.cmd = [binary,f"{iterations}"]
@@ -334,9 +429,88 @@ def setup_system(isa:str, mr:int, nr:int, simd_width:int, cpu):
 
 
 
-def simrun(isa,combo):
+# Core model setup_cpu uses for each ISA
+core_models = {"aarch64" : "O3_ARM_Neoverse_N1",
+               "riscv64" : "O3_ARM_Neoverse_N1_but_RISCV"}
+
+# Changes whenever the layout of schemas or stat files changes
+schema_version = 3
+
+def schema_key(isa : str, sweep_spec : dict):
+    import hashlib
+    import json
+    spec = {"isa" : isa, "core_model" : core_models[isa], "sweep" : sweep_spec,
+            "version" : schema_version}
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+
+def schema_path(out_dir : str, stat_filename : str, key : str):
+    return os.path.join(out_dir, f"{stat_filename}schema_{key}.json")
+
+# Host performance of every measurement, stored after the meta columns:
+# host seconds of building the system and of m5.instantiate() (the same
+# for all measurements of a simulation), of the m5.simulate() segment up
+# to workbegin and of the measured one up to workend, of reading the
+# stats, the peak RSS of the simulation process up to the measurement,
+# the simulated ticks of the measurement and committed instructions per
+# host second while simulating it
+host_columns = ["host_setup_seconds",
+                "host_instantiate_seconds",
+                "host_warmup_seconds",
+                "host_simulate_seconds",
+                "host_stats_seconds",
+                "host_peak_rss",
+                "sim_ticks",
+                "host_inst_rate"]
+
+def make_schema(key : str, isa : str, sweep_spec : dict, columns : list):
+    """
+    Fixed, ordered column layout shared by every simulation of a sweep.
+    Parameters and meta columns come first and are stored as int64, the
+    host columns and stats as float64. The first value_count columns are the values, the
+    distribution buckets follow grouped by distribution as listed in dists.
+    """
+    import re
+    param_columns = stored_params+meta_columns
+    value_columns = host_columns+[c for c in columns
+                                 if c not in param_columns+host_columns
+                                 and not re.search(r"::bucket\d+$", c)]
+    # Buckets are stored from bucket0 up to the last selected one
+    dists = {}
+    for c in columns:
+        match = re.fullmatch(r"(.*)::bucket(\d+)", c)
+        if match:
+            dists[match.group(1)] = max(dists.get(match.group(1), 0), int(match.group(2))+1)
+    bucket_columns = [f"{name}::bucket{i}" for name,count in dists.items() for i in range(count)]
+    columns = param_columns+value_columns+bucket_columns
+    value_count = len(param_columns)+len(value_columns)
+    return {"key" : key,
+            "isa" : isa,
+            "core_model" : core_models[isa],
+            "sweep" : sweep_spec,
+            "columns" : columns,
+            "dtypes" : (["int64"]*len(param_columns)+
+                        ["float64"]*len(value_columns)+
+                        ["uint32"]*len(bucket_columns)),
+            "value_count" : value_count,
+            "dists" : [[name, count] for name,count in dists.items()]}
+
+def write_schema(path : str, schema : dict):
+    import json
+    import socket
+    # Several nodes may write the same schema into a shared directory
+    tmp_path = f"{path}.{socket.gethostname()}-{os.getpid()}.tmp"
+    with open(tmp_path, "w") as schema_file:
+        json.dump(schema, schema_file, indent=1)
+    os.replace(tmp_path, path)
+
+def load_schema(path : str):
+    import json
+    with open(path) as schema_file:
+        return json.load(schema_file)
+
+
+def setup_worker_process():
     import m5
-    from m5.objects import Root
     import resource
 
     # Should be inherited from parent process, but isn't
@@ -353,7 +527,7 @@ def simrun(isa,combo):
     hardlimit = 16*1024*1024*1024
     resource.setrlimit(resource.RLIMIT_AS, (softlimit,hardlimit))
 
-
+def build_system(isa, combo):
     mr,nr,simd_lat,simd_count,simd_width,simd_phreg_count,ld_count,st_count,l1_size,iq_size,rob_size,assoc,decode_width,commit_width,fetch_buf_size = combo
     cpu = setup_cpu(isa=isa,
                     simd_lat=simd_lat, simd_count=simd_count, 
@@ -365,7 +539,344 @@ def simrun(isa,combo):
                     decode_width=decode_width,
                     commit_width=commit_width,
                     fetch_buf_size=fetch_buf_size)
-    system = setup_system(isa=isa, mr=mr, nr=nr, simd_width=simd_width, cpu=cpu)
+    return setup_system(isa=isa, mr=mr, nr=nr, simd_width=simd_width, cpu=cpu)
+
+def combo_iterations(combo, cache_line=64):
+    """
+    Iterations argument setup_system passes to the benchmark for combo,
+    without building the system
+    """
+    params = dict(zip(combo_params, combo))
+    assoc = params["assoc"]
+    _, iterations = kernel_blocking(params["mr"], params["nr"], params["simd_width"],
+                                    assoc, cache_line,
+                                    params["l1_size"]*1024/assoc/cache_line)
+    return iterations
+
+def build_checkpoint_system(isa, combo):
+    """
+    System with an atomic CPU and the same architectural state as
+    build_system(isa, combo): binary, iterations, vector length and memory
+    """
+    from m5.objects import ArmISA, RiscvISA
+    from gem5.utils.requires import requires
+    from gem5.isas import ISA
+
+    params = dict(zip(combo_params, combo))
+    simd_width = params["simd_width"]
+    if "aarch64" == isa:
+        from m5.objects import ArmAtomicSimpleCPU
+        requires(isa_required=ISA.ARM)
+        cpu = ArmAtomicSimpleCPU(isa=ArmISA(sve_vl_se=simd_width/128))
+    elif "riscv64" == isa:
+        from m5.objects import RiscvAtomicSimpleCPU
+        requires(isa_required=ISA.RISCV)
+        cpu = RiscvAtomicSimpleCPU(isa=RiscvISA(vlen=simd_width))
+    else:
+        raise RuntimeError(f"Unsupported ISA: {isa}")
+    return setup_system(isa=isa, mr=params["mr"], nr=params["nr"],
+                        simd_width=simd_width, cpu=cpu,
+                        iterations=combo_iterations(combo))
+
+def probe_stat_columns(isa, combo, include, exclude):
+    """
+    Instantiate (but don't simulate) a configuration and return the stat
+    columns it produces. Used once per sweep to create the schema.
+    """
+    import m5
+    from m5.objects import Root
+
+    setup_worker_process()
+    system = build_system(isa, combo)
+    root = Root(full_system=False, system=system)
+    m5.instantiate()
+
+    stat_filter = compile_stat_filter(include, exclude)
+    statmap = {}
+    build_stat_tree(statmap, name="", groups=root.getStatGroups(),
+                    stat_filter=stat_filter)
+    return stat_columns(statmap, stat_filter)
+
+
+def share_records(records, key : str):
+    """
+    Copy the (column x measurement) records of one simulation into a
+    shared memory block and return a small descriptor instead of the data.
+    The data-processing side maps the block with map_shared_records and
+    unlinks it.
+    """
+    from multiprocessing import shared_memory, resource_tracker
+    import numpy as np
+
+    shm = shared_memory.SharedMemory(create=True,
+                                     size=max(1,records.nbytes))
+    shared = np.ndarray(records.shape, dtype=np.float64, buffer=shm.buf)
+    shared[:] = records
+    del shared
+    # The worker exits right after this simulation, the resource tracker
+    # must not unlink the block before the data-processing process mapped it
+    resource_tracker.unregister(shm._name, "shared_memory")
+    shm.close()
+    return ("shm", shm.name, records.shape, key)
+
+def map_shared_records(message):
+    """
+    Map a block created by share_records without copying. Returns the
+    records and the SharedMemory handle, which can be closed once the
+    records aren't used anymore.
+    """
+    from multiprocessing import shared_memory
+    import numpy as np
+
+    _, name, shape, _ = message
+    shm = shared_memory.SharedMemory(name=name)
+    # The mapping stays valid after unlinking, nobody else needs the name
+    shm.unlink()
+    return np.ndarray(shape, dtype=np.float64, buffer=shm.buf), shm
+
+def discard_shared_records(message):
+    """
+    Unlink a block created by share_records without reading it. Nothing
+    else unlinks it, share_records unregistered it from the resource tracker.
+    """
+    from multiprocessing import shared_memory
+
+    _, name, _, _ = message
+    shm = shared_memory.SharedMemory(name=name)
+    shm.unlink()
+    shm.close()
+
+
+summary_stat_names = ["system.cpu.numCycles",
+                      "system.cpu.commitStats0.committedInstType"]
+
+def measurement_efficiency(summary_stats : dict, combo):
+    """
+    Cycles and FP efficiency of the last measurement, same definition as
+    data_extraction.extract_target
+    """
+    simd_count = combo[combo_params.index("simd_count")]
+    cycles_stat = summary_stats["system.cpu.numCycles"]
+    cycles_stat.prepare()
+    cycles = cycles_stat.result
+    inst_stat = summary_stats["system.cpu.commitStats0.committedInstType"]
+    inst_stat.prepare()
+    inst_counts = dict(zip(inst_stat.subnames, inst_stat.value))
+    min_cycles_possible = (inst_counts.get("SimdFloatMultAcc", 0.0) +
+                           inst_counts.get("SimdFloatMult", 0.0))/simd_count
+    return cycles, min_cycles_possible/max(1.0,cycles)
+
+def committed_instructions(summary_stats : dict):
+    inst_stat = summary_stats["system.cpu.commitStats0.committedInstType"]
+    inst_stat.prepare()
+    return sum(inst_stat.value)
+
+def sim_summary(combo, cycle_history : list, efficiency_history : list,
+                host_seconds=None, phase_seconds=None, peak_rss=None):
+    # What simrun returns to the driver, the full stats go to the
+    # data-processing processes
+    return {"combo" : tuple(combo),
+            "measurements" : len(cycle_history),
+            "cycles" : min(cycle_history, default=None),
+            "efficiency" : max(efficiency_history, default=None),
+            "host_seconds" : host_seconds,
+            "phase_seconds" : phase_seconds or {},
+            "peak_rss" : peak_rss,
+            "cached" : False}
+
+def measurements_converged(cycle_history : list, count : int, tolerance : float):
+    # The last count measurements agree within the relative tolerance
+    if len(cycle_history) < count:
+        return False
+    window = cycle_history[-count:]
+    return max(window)-min(window) <= tolerance*max(window)
+
+
+def checkpoint_key(isa : str, combo, build_hash : str):
+    """
+    Identifies the architectural state at the first workbegin, shared by
+    all combinations differing only in microarchitectural parameters
+    """
+    import hashlib
+    import json
+    params = dict(zip(combo_params, combo))
+    binary = benchmark_binary(isa, params["mr"], params["nr"])
+    spec = json.dumps({"isa" : isa,
+                       "binary" : file_digest(binary),
+                       "iterations" : combo_iterations(combo),
+                       "simd_width" : params["simd_width"],
+                       "build" : build_hash}, sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+def create_checkpoint(isa, combo, checkpoint_path : str):
+    # Runs in a child process, gem5 can only instantiate once per process
+    import m5
+    from m5.objects import Root
+
+    # Forked from a simulation that already created its Root, which is
+    # never instantiated in this process
+    Root._the_instance = None
+    system = build_checkpoint_system(isa, combo)
+    # m5.instantiate() takes the Root singleton
+    Root(full_system=False, system=system)
+    m5.instantiate()
+    exit_event = m5.simulate()
+    if "workbegin" != exit_event.getCause():
+        raise RuntimeError(f"Benchmark exited before workbegin: {exit_event.getCause()}")
+    print(f"Writing workbegin checkpoint @ tick {m5.curTick()} to {checkpoint_path}")
+    m5.checkpoint(checkpoint_path)
+
+# The owner of a checkpoint lock renews it every tenth of this, a lock not
+# renewed for this long is left over from a crashed process
+checkpoint_lock_seconds = 600
+
+def create_lock(lock_path : str, owner : str):
+    # True if this process created lock_path, it contains the owner
+    try:
+        fd = os.open(lock_path, os.O_CREAT|os.O_EXCL|os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as lock_file:
+        lock_file.write(owner)
+    return True
+
+def release_lock(lock_path : str, owner : str):
+    # Only a lock still owned is removed, it may have been taken over
+    try:
+        with open(lock_path) as lock_file:
+            if lock_file.read() != owner:
+                return
+        os.remove(lock_path)
+    except FileNotFoundError:
+        pass
+
+def lock_is_stale(lock_path : str):
+    try:
+        return time.time()-os.stat(lock_path).st_mtime > checkpoint_lock_seconds
+    except FileNotFoundError:
+        return False
+
+def remove_stale_lock(lock_path : str, owner : str):
+    """
+    Remove lock_path if its owner stopped renewing it. Only the owner of
+    <lock_path>.break checks and removes it, otherwise two processes
+    finding the same stale lock could both remove it, the second one
+    after a third process took the lock again.
+    """
+    break_path = f"{lock_path}.break"
+    if not create_lock(break_path, owner):
+        # Held for a few milliseconds, unless its owner crashed then
+        if lock_is_stale(break_path):
+            try:
+                os.remove(break_path)
+            except FileNotFoundError:
+                pass
+        return
+    try:
+        if lock_is_stale(lock_path):
+            os.remove(lock_path)
+    except FileNotFoundError:
+        pass
+    finally:
+        release_lock(break_path, owner)
+
+def workbegin_checkpoint(isa, combo, checkpoint_dir : str, build_hash : str):
+    """
+    Directory of the checkpoint at the first workbegin of the benchmark
+    run by combo. A missing checkpoint is created by a forked child with an
+    atomic CPU, this must happen before anything is instantiated. Returns
+    None if another process is creating it or creating it failed, the
+    simulation then runs from the start.
+    """
+    import shutil
+    import socket
+
+    key = checkpoint_key(isa, combo, build_hash)
+    checkpoint_path = os.path.join(checkpoint_dir, key[:2], key)
+    if os.path.exists(checkpoint_path):
+        return checkpoint_path
+    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+    lock_path = f"{checkpoint_path}.lock"
+    owner = f"{socket.gethostname()}-{os.getpid()}"
+    if not create_lock(lock_path, owner):
+        remove_stale_lock(lock_path, owner)
+        return None
+
+    tmp_path = f"{checkpoint_path}.{owner}.tmp"
+    try:
+        pid = os.fork()
+        if 0 == pid:
+            status = 1
+            try:
+                create_checkpoint(isa, combo, tmp_path)
+                status = 0
+            except Exception:
+                import traceback
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                os._exit(status)
+        renewed = time.time()
+        while True:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                break
+            if time.time()-renewed > checkpoint_lock_seconds/10:
+                renewed = time.time()
+                try:
+                    os.utime(lock_path)
+                except FileNotFoundError:
+                    pass
+            time.sleep(1)
+        if 0 == status:
+            try:
+                os.rename(tmp_path, checkpoint_path)
+            except OSError:
+                # Published by a process that took over a stale lock
+                if not os.path.exists(checkpoint_path):
+                    raise
+        else:
+            print(f"Creating checkpoint {key} failed with status {status}")
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        release_lock(lock_path, owner)
+    return checkpoint_path if os.path.exists(checkpoint_path) else None
+
+
+def resolve_params(root):
+    # What m5.instantiate() does first: adopt orphaned SimObjects and
+    # resolve the proxy params, afterwards the configuration is final
+    for obj in root.descendants():
+        obj.adoptOrphanParams()
+    for obj in root.descendants():
+        obj.unproxyParams()
+
+
+def import_sim_modules():
+    # Everything a simulation imports, so a fork server can do it once
+    import numpy
+    import m5
+    import m5.objects
+    import _m5.stats
+    from gem5.utils.requires import requires
+    from gem5.isas import ISA
+    from common.cores.arm.O3_ARM_Neoverse_N1 import O3_ARM_Neoverse_N1
+
+
+def simrun(isa,combo):
+    host_start = time.time()
+    phase_seconds = {"startup" : host_start-simrun.process_start}
+    import_sim_modules()
+    import m5
+    from m5.objects import Root
+    import numpy as np
+    phase_seconds["import"] = time.time()-host_start
+
+    phase_start = time.time()
+    setup_worker_process()
+    system = build_system(isa, combo)
+    root = Root(full_system=False, system=system)
+    phase_seconds["setup"] = time.time()-phase_start
 
     #m5.options.outdir=os.path.join(base_out_dir,f"gemm_m5_M{mr}_N{nr}_lat{simd_lat}_vl{simd_width}_nfu{simd_count}_dw{decode_width}_cw{commit_width}_fbs{fetch_buf_size}_l1as{assoc}_st{st_count}_ld{ld_count}_l1d{l1_size}_phr{simd_phreg_count}_rob{rob_size}")
     #print(f"gem5 output directory: {m5.options.outdir}")
@@ -376,168 +887,796 @@ def simrun(isa,combo):
     #print(f"created output dir")
     #m5.core.setOutputDir(m5.options.outdir)
 
-    root = Root(full_system=False, system=system)
-    m5.instantiate()
+    schema = simrun.schema
+    column_count = len(schema["columns"])
+    column_index = {c : i for i,c in enumerate(schema["columns"])}
+    param_idx = [column_index[k] for k in combo_params]
+
+    cache_dir = simrun.options["cache_dir"]
+    if cache_dir:
+        # Before creating a checkpoint or instantiating, which a cached
+        # result doesn't need
+        resolve_params(root)
+        fingerprint = config_fingerprint(root,
+                                         benchmark_binary(isa, combo[0], combo[1]),
+                                         simrun.options["build_hash"],
+                                         simrun.options)
+        # The host columns measured the simulation that stored the entry,
+        # they are NaN in the rows of a cache hit. sim_ticks is a result of
+        # the simulation like the stats
+        uncached = [c for c in host_columns if "sim_ticks" != c]+["cache_hit"]
+        cached_columns = [c for c in schema["columns"] if c not in uncached]
+        cached = load_cached_result(cache_dir, fingerprint, cached_columns)
+        if cached is not None:
+            cached_records, history = cached
+            print(f"Using cached result {fingerprint}")
+            records = np.full((column_count, cached_records.shape[1]), np.nan)
+            records[[column_index[c] for c in cached_columns],:] = cached_records
+            if "cache_hit" in column_index:
+                records[column_index["cache_hit"],:] = 1
+            # Parameter values of this sweep, the cached simulation may
+            # have been part of a sweep with other parameter names
+            records[param_idx,:] = np.array(combo)[:,None]
+            send_records(records, schema["key"])
+            summary = sim_summary(combo, history["cycles"], history["efficiency"],
+                                  host_seconds=time.time()-host_start,
+                                  phase_seconds=phase_seconds)
+            summary["cached"] = True
+            return summary
+
+    checkpoint = None
+    if simrun.options["checkpoint_dir"]:
+        phase_start = time.time()
+        checkpoint = workbegin_checkpoint(isa, combo,
+                                          simrun.options["checkpoint_dir"],
+                                          simrun.options["build_hash"])
+        phase_seconds["checkpoint"] = time.time()-phase_start
+
+    phase_start = time.time()
+    if checkpoint is None:
+        m5.instantiate()
+    else:
+        print(f"Restoring workbegin checkpoint {checkpoint}")
+        m5.instantiate(checkpoint)
+    phase_seconds["instantiate"] = time.time()-phase_start
 
+    stat_filter = compile_stat_filter(schema["sweep"]["stats"],
+                                      schema["sweep"]["stats_exclude"])
     statgroups = root.getStatGroups()
     statmap = {}
-    build_stat_tree(statmap, name="", groups=statgroups)
-
-    stat_df = pd.DataFrame(columns=[name for name in statmap.keys()])
-    stat_df.reset_index(drop=True,inplace=True)
-    statdict = prepare_statdict(statmap)
+    build_stat_tree(statmap, name="", groups=statgroups,
+                    stat_filter=stat_filter)
+
+    layout = compile_stat_layout(statmap, column_index)
+    run_idx = column_index["run"]
+    cycles_idx = column_index.get("system.cpu.numCycles", -1)
+    measurements_idx = column_index.get("measurements", -1)
+    host_idx = [column_index[c] for c in host_columns]
+
+    converge = simrun.options["converge"]
+    converge_tol = simrun.options["converge_tol"]
+    # The driver needs these independent of --stats
+    summary_stats = {}
+    build_stat_tree(summary_stats, name="", groups=statgroups,
+                    stat_filter=compile_stat_filter(summary_stat_names,[]))
+    cycle_history = []
+    efficiency_history = []
 
+    import resource
 
+    rows = []
     run = 0
+    warmup_seconds = 0.0
+    if checkpoint is not None:
+        # Restored right after the first workbegin, the caches and
+        # predictors are cold
+        m5.stats.reset()
+    begin_tick = m5.curTick()
+    phase_seconds["simulate"] = 0.0
+    phase_seconds["stats"] = 0.0
     noexit=True
     print("starting workload loop")
     while noexit:
+        phase_start = time.time()
         exit_event = m5.simulate()
+        segment_seconds = time.time()-phase_start
+        phase_seconds["simulate"] += segment_seconds
         if "workbegin" == exit_event.getCause():
             print("workbegin event detected, resetting statistics")
             m5.stats.reset()
+            warmup_seconds = segment_seconds
+            begin_tick = m5.curTick()
         elif "workend" == exit_event.getCause():
             print("workend event detected, dumping statistics")
             #m5.stats.dump()
-            append_stats(statmap,statdict)
-            statdict["mr"].append(mr)
-            statdict["nr"].append(nr)
-            statdict["simd_lat"].append(simd_lat)
-            statdict["simd_count"].append(simd_count)
-            statdict["simd_width"].append(simd_width)
-            statdict["simd_phreg_count"].append(simd_phreg_count)
-            statdict["ld_count"].append(ld_count)
-            statdict["st_count"].append(st_count)
-            statdict["l1_size"].append(l1_size)
-            statdict["iq_size"].append(iq_size)
-            statdict["rob_size"].append(rob_size)
-            statdict["assoc"].append(assoc)
-            statdict["decode_width"].append(decode_width)
-            statdict["commit_width"].append(commit_width)
-            statdict["fetch_buf_size"].append(fetch_buf_size)
-            statdict["run"].append(run)
+            phase_start = time.time()
+            row = np.zeros(column_count)
+            fill_stat_row(layout, row)
+            stats_seconds = time.time()-phase_start
+            phase_seconds["stats"] += stats_seconds
+            row[param_idx] = combo
+            row[run_idx] = run
+            # ru_maxrss is in KiB on Linux
+            row[host_idx] = [phase_seconds["setup"],
+                             phase_seconds["instantiate"],
+                             warmup_seconds,
+                             segment_seconds,
+                             stats_seconds,
+                             resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024,
+                             m5.curTick()-begin_tick,
+                             committed_instructions(summary_stats)/max(segment_seconds,1e-9)]
+            rows.append(row)
             run = run+1
-            cycle_value = statdict["system.cpu.numCycles"][run-1]
-            print(f"Cycles: {cycle_value}")
+            if -1 != cycles_idx:
+                print(f"Cycles: {row[cycles_idx]}")
+            cycles, efficiency = measurement_efficiency(summary_stats, combo)
+            cycle_history.append(cycles)
+            efficiency_history.append(efficiency)
+            if converge:
+                if measurements_converged(cycle_history, converge, converge_tol):
+                    print(f"Cycles converged after {run} measurements, ending simulation")
+                    noexit=False
         else:
             print("exit event neither workbegin nor workend, ending simulation")
             noexit=False
 
     print("Exiting @ tick %i because %s" % (m5.curTick(), exit_event.getCause()))
 
+    if rows:
+        records = np.stack(rows, axis=1)
+    else:
+        records = np.zeros((column_count,0))
+    if -1 != measurements_idx:
+        records[measurements_idx,:] = run
+    if cache_dir:
+        store_cached_result(cache_dir, fingerprint, schema["columns"], records,
+                            {"cycles" : cycle_history, "efficiency" : efficiency_history})
+    phase_start = time.time()
+    send_records(records, schema["key"])
+    phase_seconds["enqueue"] = time.time()-phase_start
+
+    # ru_maxrss is in KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+    return sim_summary(combo, cycle_history, efficiency_history,
+                       host_seconds=time.time()-host_start,
+                       phase_seconds=phase_seconds,
+                       peak_rss=peak_rss)
+
+def send_records(records, key : str):
+    """
+    Send the records of a simulation to its data-processing process. A
+    simulation sends one result, the queue is closed and its feeder thread
+    joined, so the records are in the pipe before the summary reaches the
+    driver. The driver ends data processing once every simulation
+    reported.
+    """
+    if "shm" == simrun.options["transport"]:
+        simrun.q.put(share_records(records, key))
+    else:
+        simrun.q.put(("array", records, records.shape, key))
+    simrun.q.close()
+    simrun.q.join_thread()
 
-    reference_key = "system.cpu.numCycles"
-    def fix_stat_list(d : dict, k : str, must_len : int):
-        v = d[k]
-        vlen = len(v)
-        if vlen < must_len:
-            d[k].extend([0]*(must_len-vlen))
-        elif vlen > must_len:
-            # This shouldn't happen, but who knows
-            del d[k][must_len:]
-    for k in statdict.keys():
-       fix_stat_list(statdict, k, len(statdict[reference_key]))
-    simrun.q.put(pd.DataFrame(statdict))
-
-def simrun_init(result_queues):
+def simrun_init(result_queues, schema, options):
 
     from gem5.utils.multiprocessing.context import gem5Context
     
     queue_id = int(gem5Context().current_process().name.split('-')[1])%len(result_queues)
     simrun.q = result_queues[queue_id]
+    simrun.options = options
+    simrun.schema = schema
+    # Startup of the worker process up to here (gem5 boot, imports of
+    # this script) is the "startup" phase of the simulation
+    simrun.process_start = psutil.Process().create_time()
+
+
+def fork_server(task_queue, done_queue, crash_queue,
+                result_queues, schema, options):
+    """
+    Template process for --fork_server: imports everything a simulation
+    needs once, then forks one child per task. No SimObject exists before
+    the fork, so every child starts from a clean gem5 state.
+    The template itself never puts anything on done_queue or the result
+    queues, so the children inherit them unused. Like the template, the
+    children ignore SIGTERM, see main().
+    """
+    import_start = time.time()
+    import_sim_modules()
+    print(f"Fork server imported simulation modules in {time.time()-import_start:.2f}s")
+
+    children = {}
+    def reap(block : bool):
+        while children:
+            pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+            if 0 == pid:
+                return
+            task_id = children.pop(pid)
+            exitcode = os.waitstatus_to_exitcode(status)
+            # 0: result sent, 1: exception sent by the child
+            if exitcode not in (0,1):
+                crash_queue.put((task_id, f"simulation process exited with {exitcode}"))
+            if not block:
+                continue
+            return
+
+    while True:
+        try:
+            task = task_queue.get(timeout=1)
+        except queue.Empty:
+            reap(block=False)
+            continue
+        if task is None:
+            break
+        task_id, function, args = task
+        pid = os.fork()
+        if 0 == pid:
+            simrun.q = result_queues[task_id%len(result_queues)]
+            simrun.options = options
+            simrun.schema = schema
+            simrun.process_start = time.time()
+            exitcode = 0
+            try:
+                done = (task_id, True, function(*args))
+            except BaseException as exc:
+                done = (task_id, False, repr(exc))
+                exitcode = 1
+            # os._exit doesn't flush the queue feeder threads. The records
+            # are sent before the driver learns that the simulation is done
+            simrun.q.close()
+            simrun.q.join_thread()
+            done_queue.put(done)
+            done_queue.close()
+            done_queue.join_thread()
+            os._exit(exitcode)
+        children[pid] = task_id
+        reap(block=False)
+    while children:
+        reap(block=True)
+
+
+class ForkServerPool:
+    """
+    The subset of the multiprocessing Pool interface dispatch_simulations
+    and main() use, running every task in a child of a fork_server
+    """
+    def __init__(self, result_queues, schema, options):
+        import threading
+        from gem5.utils.multiprocessing.context import gem5Context
+
+        self.task_queue = gem5Context().Queue()
+        self.done_queue = gem5Context().Queue()
+        self.crash_queue = gem5Context().Queue()
+        self.server = gem5Context().Process(target=fork_server,
+                                            args=(self.task_queue,
+                                                  self.done_queue,
+                                                  self.crash_queue,
+                                                  result_queues,
+                                                  schema,
+                                                  options))
+        self.server.start()
+        self.callbacks = {}
+        self.next_task_id = 0
+        self.listeners = [threading.Thread(target=self.collect, args=(q,), daemon=True)
+                          for q in [self.done_queue, self.crash_queue]]
+        for listener in self.listeners:
+            listener.start()
+
+    def apply_async(self, function, args, callback, error_callback):
+        task_id = self.next_task_id
+        self.next_task_id = task_id+1
+        self.callbacks[task_id] = (callback, error_callback)
+        self.task_queue.put((task_id, function, args))
+
+    def collect(self, result_queue):
+        while True:
+            message = result_queue.get()
+            if message is None:
+                return
+            if 3 == len(message):
+                task_id, ok, payload = message
+            else:
+                (task_id, payload), ok = message, False
+            callbacks = self.callbacks.pop(task_id, None)
+            if callbacks is None:
+                # Crashed after sending its result
+                continue
+            callback, error_callback = callbacks
+            if ok:
+                callback(payload)
+            else:
+                error_callback(RuntimeError(payload))
+
+    def close(self):
+        self.task_queue.put(None)
+
+    def terminate(self):
+        # The template and the simulations ignore SIGTERM. Nothing is
+        # forked anymore once the template is gone
+        try:
+            simulations = psutil.Process(self.server.pid).children()
+        except psutil.NoSuchProcess:
+            simulations = []
+        self.server.kill()
+        for simulation in simulations:
+            try:
+                simulation.kill()
+            except psutil.NoSuchProcess:
+                pass
+
+    def join(self):
+        self.server.join()
+        for q in [self.done_queue, self.crash_queue]:
+            q.put(None)
+        for listener in self.listeners:
+            listener.join()
+
+
+def terminate_pool(pool):
+    """
+    Abandon the running simulations of pool. Pool.terminate() sends
+    SIGTERM, which the workers ignore, and waits for them to exit, so they
+    are killed while it runs. Until then the pool replaces killed workers.
+    """
+    import threading
+
+    if isinstance(pool, ForkServerPool):
+        pool.terminate()
+        return
+    terminator = threading.Thread(target=pool.terminate)
+    terminator.start()
+    while terminator.is_alive():
+        for worker in list(pool._pool):
+            if worker.exitcode is None:
+                worker.kill()
+        terminator.join(timeout=0.1)
 
 
 def process_results(basename:str,
                     out_dir:str,
                     split_bytes:int,
-                    queue,
-                    end_event):
-    import gc
+                    schema:dict,
+                    result_queue,
+                    flush_bytes:int,
+                    flush_seconds:float,
+                    backlog):
+    """
+    Collect the results of the simulations and append them to the stat
+    stores of their partitions every flush_seconds or once flush_bytes of
+    results are buffered. A partition continues in a new file after
+    split_bytes, finished files are compacted with compact_stat_store.
+    The number of buffered rows is published in the shared value backlog.
+    Ends with the None sentinel main() puts on result_queue once every
+    simulation has exited, so no result sent before is left in the queue.
+    """
+    import numpy as np
+    import signal
 
-    stat_df=pd.DataFrame()
-    
-    print("Starting processing loop")
+    # SLURM signals every process of the job, the driver ends this process
+    # with a sentinel once it drained the sweep
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
 
-    df_list = []
-    df_merge_count = 100
-    out_file_count = 0
-    while not end_event.is_set() or not queue.empty():
-        result = queue.get()
+    columns = schema["columns"]
+    column_count = len(columns)
+    partition_idx = [columns.index(p) for p in partition_params]
 
-        if result.empty:
-            continue
+    # Every simulation uses the schema layout, so merging results is
+    # a plain copy into this (column x row) buffer
+    records = np.empty((column_count, 1024))
+    row_count = 0
+    last_flush = time.time()
+    
+    print("Starting processing loop")
 
-        #if not statdict:
-        #    statdict = result
-        #    for k in statdict.keys():
-        #       fix_stat_list(result, k, len(statdict[reference_key]))
-        #else:
-        #    must_len_old = len(statdict[reference_key])
-        #    must_len_new = len(result[reference_key])
-        #    for k in result.keys():
-        #        if k not in statdict:
-        #            statdict[k] = [0]*must_len_old
-        #        if k not in result:
-        #            result[k] = [0]*must_len_new
-        #        fix_stat_list(result, k, must_len_new)
-        #        fix_stat_list(statdict, k, must_len_old)
-        #        statdict[k].extend(result[k])
-
-        if stat_df.empty:
-            stat_df = result
-        else:
-            df_list.append(result)
-
-        if len(df_list) > df_merge_count:
-            stat_df = pd.concat([stat_df]+df_list)
-            for df in df_list:
-                del df
-            gc.collect()
-            df_list = []
-
-        if stat_df.memory_usage(index=True).sum() > split_bytes:
-            h5_filepath = os.path.join(out_dir,
-                                       f"{basename}{out_file_count}.h5")
-            #stat_df = pd.DataFrame(statdict)
-            print(f"Saving partial data to {h5_filepath}")
-            stat_df.to_hdf(h5_filepath, 
-                           "gem5stats", 
-                           mode='w',
-                           complevel=4,
-                           complib='blosc:zstd')
+    # partition -> (path of the current file, bytes appended to it)
+    stores = {}
+    def next_h5_filepath(partition):
+        # Files from an interrupted run are kept when resuming
+        directory = partition_dir(out_dir, partition)
+        os.makedirs(directory, exist_ok=True)
+        out_file_count = 0
+        h5_filepath = os.path.join(directory, f"{basename}{out_file_count}.h5")
+        while os.path.exists(h5_filepath):
             out_file_count = out_file_count + 1
-            del stat_df
-            gc.collect()
-            stat_df = pd.DataFrame()
-            #for v in statdict.values():
-            #    del v[:]
-    if df_list:
-        if stat_df.empty:
-            stat_df = pd.concat(df_list)
+            h5_filepath = os.path.join(directory, f"{basename}{out_file_count}.h5")
+        return h5_filepath
+
+    def append_records(new_records):
+        nonlocal records
+        nonlocal row_count
+        new_count = new_records.shape[1]
+        if row_count+new_count > records.shape[1]:
+            capacity = max(2*records.shape[1], row_count+new_count)
+            grown = np.empty((column_count, capacity))
+            grown[:,:row_count] = records[:,:row_count]
+            records = grown
+        records[:,row_count:row_count+new_count] = new_records
+        row_count = row_count+new_count
+        backlog.value = row_count
+
+    def save_records():
+        nonlocal row_count
+        nonlocal last_flush
+        buffered = records[:,:row_count]
+        partitions = np.unique(buffered[partition_idx,:].T.astype(np.int64), axis=0)
+        for partition in map(tuple, partitions):
+            selected = np.all(buffered[partition_idx,:].T == partition, axis=1)
+            block = buffered[:,selected]
+            h5_filepath, written = stores.get(partition, (None, split_bytes))
+            if written >= split_bytes:
+                if h5_filepath is not None:
+                    compact_stat_store(h5_filepath)
+                h5_filepath, written = next_h5_filepath(partition), 0
+                print(f"Saving data to {h5_filepath}")
+                create_stat_store(h5_filepath, schema)
+            append_stat_store(h5_filepath, schema, block)
+            append_completed_index(h5_filepath, block[[columns.index(p) for p in combo_params],:])
+            stores[partition] = (h5_filepath, written+block.nbytes)
+        row_count = 0
+        backlog.value = 0
+        last_flush = time.time()
+
+    while True:
+        try:
+            result = result_queue.get(timeout=flush_seconds)
+        except queue.Empty:
+            pass
+        else:
+            if result is None:
+                break
+            kind, _, shape, key = result
+            if key != schema["key"]:
+                print(f"Dropping result with schema {key}, expected {schema['key']}")
+                if "shm" == kind:
+                    discard_shared_records(result)
+                continue
+
+            if "shm" == kind:
+                shared, shm = map_shared_records(result)
+                append_records(shared)
+                del shared
+                shm.close()
+            else:
+                append_records(result[1])
+
+        if row_count and (8*column_count*row_count > flush_bytes or
+                          time.time()-last_flush > flush_seconds):
+            save_records()
+
+    if row_count:
+        save_records()
+    for h5_filepath,_ in stores.values():
+        compact_stat_store(h5_filepath)
+
+
+class CostModel:
+    """
+    Estimated host time of a simulation. The analytic cost is the number
+    of simulated kernel instructions over all measurements plus the
+    initialization of the A and B buffers. It is calibrated to seconds with
+    the host times recorded in <stat_filename>hosttimes.csv by earlier runs,
+    and combinations simulated before use their recorded time.
+    """
+    measurements = 8
+
+    def __init__(self, history_path : str):
+        import numpy as np
+        self.history_path = history_path
+        self.recorded = {}
+        self.analytic = {}
+        self.seconds_per_unit = None
+        if os.path.exists(history_path):
+            with open(history_path, newline='') as history_file:
+                reader = csv.reader(history_file)
+                header = next(reader)
+                if header != combo_params+["host_seconds"]:
+                    raise RuntimeError(f"Unexpected header in {history_path}: {header}")
+                for row in reader:
+                    combo = tuple(int(v) for v in row[:len(combo_params)])
+                    self.recorded[combo] = float(row[len(combo_params)])
+        if self.recorded:
+            recorded = list(self.recorded)
+            ratios = sorted((np.array([self.recorded[c] for c in recorded])/
+                             self.analytic_costs(recorded)).tolist())
+            self.seconds_per_unit = ratios[len(ratios)//2]
+            print(f"Calibrated cost model with {len(ratios)} recorded host times")
+        write_header = not os.path.exists(history_path)
+        self.history_file = open(history_path, "a", newline='')
+        self.history_writer = csv.writer(self.history_file)
+        if write_header:
+            self.history_writer.writerow(combo_params+["host_seconds"])
+
+    @staticmethod
+    def analytic_costs(combinations):
+        import numpy as np
+        params = dict(zip(combo_params, np.array(combinations, dtype=np.int64).reshape(-1, len(combo_params)).T))
+        mr, nr = params["mr"], params["nr"]
+        cl = 64
+        model = blis_model.blocking(mr, nr, params["simd_width"],
+                                    l1_sets=blis_model.cache_sets(params["l1_size"]*1024,
+                                                                  params["assoc"], cl),
+                                    l1_assoc=params["assoc"],
+                                    cache_line=cl)
+        kc = np.maximum(1, model["unroll"]*model["iterations"])
+        kernel_instructions = CostModel.measurements*kc*(mr*nr+mr+nr)
+        init_instructions = kc*(model["mr_elem"]+nr)
+        return kernel_instructions+init_instructions
+
+    @staticmethod
+    def analytic_cost(combo):
+        return float(CostModel.analytic_costs([combo])[0])
+
+    def prime(self, combinations):
+        # Model all combinations of a sweep at once
+        self.analytic.update(zip(combinations,
+                                 CostModel.analytic_costs(combinations).tolist()))
+
+    def estimate(self, combo):
+        if combo in self.recorded:
+            return self.recorded[combo]
+        cost = self.analytic.get(combo)
+        if cost is None:
+            cost = self.analytic_cost(combo)
+        if self.seconds_per_unit is not None:
+            return cost*self.seconds_per_unit
+        return cost
+
+    def record(self, summary):
+        # Cached results say nothing about the cost of simulating
+        if summary["host_seconds"] is None or summary["cached"]:
+            return
+        self.history_writer.writerow(list(summary["combo"])+[summary["host_seconds"]])
+        self.history_file.flush()
+
+
+class MemoryAdmission:
+    """
+    Decides whether another simulation fits into memory. Simulations are
+    grouped into configuration classes by simd_width, l1_size and kc, which
+    size the buffers of the benchmark. The footprint of a class is the
+    largest peak RSS measured for it (in earlier runs too, recorded in
+    <stat_filename>memory.csv) plus a margin. Classes without measurements
+    are assumed to need as much as the largest known class.
+    """
+    header = ["simd_width","l1_size","kc","peak_rss"]
+
+    def __init__(self, history_path : str, budget : int,
+                 initial_footprint : int, margin : float, min_free : int):
+        self.budget = budget
+        self.initial_footprint = initial_footprint
+        self.margin = margin
+        self.min_free = min_free
+        self.peak_rss = {}
+        self.inflight = {}
+        if os.path.exists(history_path):
+            with open(history_path, newline='') as history_file:
+                reader = csv.reader(history_file)
+                header = next(reader)
+                if header != self.header:
+                    raise RuntimeError(f"Unexpected header in {history_path}: {header}")
+                for row in reader:
+                    self.learn(tuple(int(v) for v in row[:3]), int(row[3]))
+            print(f"Loaded peak memory usage of {len(self.peak_rss)} configuration classes")
+        write_header = not os.path.exists(history_path)
+        self.history_file = open(history_path, "a", newline='')
+        self.history_writer = csv.writer(self.history_file)
+        if write_header:
+            self.history_writer.writerow(self.header)
+
+    @staticmethod
+    def config_class(combo):
+        params = dict(zip(combo_params, combo))
+        cl = 64
+        nl = params["l1_size"]*1024/params["assoc"]/cl
+        unroll, iterations = kernel_blocking(params["mr"], params["nr"],
+                                             params["simd_width"],
+                                             params["assoc"], cl, nl)
+        return (params["simd_width"], params["l1_size"], max(1, unroll*iterations))
+
+    def learn(self, config_class, peak_rss : int):
+        self.peak_rss[config_class] = max(peak_rss, self.peak_rss.get(config_class, 0))
+
+    def footprint(self, combo):
+        config_class = self.config_class(combo)
+        if config_class in self.peak_rss:
+            peak_rss = self.peak_rss[config_class]
         else:
-            stat_df = pd.concat([stat_df]+df_list)
-        for df in df_list:
-            del df
-        gc.collect()
-        df_list = []
-
-    if not stat_df.empty:
-        h5_filepath = os.path.join(out_dir,
-                                   f"{basename}{out_file_count}.h5")
-        stat_df.to_hdf(h5_filepath, 
-                        "gem5stats", 
-                        mode='w',
-                        complevel=4,
-                        complib='blosc:zstd')
-        del stat_df
-        gc.collect()
+            peak_rss = max(self.peak_rss.values(), default=self.initial_footprint)
+        return int((1.0+self.margin)*peak_rss)
+
+    def reserved(self):
+        return sum(self.inflight.values())
+
+    def admit(self, combo, task_id):
+        """
+        Reserve the footprint of combo if it fits into the budget and the
+        system still has min_free bytes available after it starts. A single
+        simulation is always admitted, so an oversized class still runs.
+        """
+        footprint = self.footprint(combo)
+        if self.inflight:
+            if self.reserved()+footprint > self.budget:
+                return False
+            if psutil.virtual_memory().available-footprint < self.min_free:
+                return False
+        self.inflight[task_id] = footprint
+        return True
+
+    def release(self, task_id, summary):
+        del self.inflight[task_id]
+        # A cache hit didn't simulate, its peak RSS says nothing about the
+        # class
+        if summary["peak_rss"] is None or summary["cached"]:
+            return
+        config_class = self.config_class(summary["combo"])
+        self.learn(config_class, summary["peak_rss"])
+        self.history_writer.writerow(list(config_class)+[summary["peak_rss"]])
+        self.history_file.flush()
+
+
+class Telemetry:
+    """
+    Appends the state of this node's sweep as one JSON object per line to
+    path, every interval seconds and when the sweep ends. Combine the
+    files of all nodes with python -m analysis.telemetry_status.
+    """
+    def __init__(self, path : str, interval : float, node_rank : int,
+                 result_queues : list, dp_backlogs : list, admission, progress):
+        import socket
+        self.path = path
+        self.interval = interval
+        self.node = f"{socket.gethostname()}-{os.getpid()}"
+        self.node_rank = node_rank
+        self.result_queues = result_queues
+        self.dp_backlogs = dp_backlogs
+        self.admission = admission
+        self.progress = progress
+        self.start = time.time()
+        self.last_emit = 0.0
+        self.completed = 0
+        self.failed = 0
+        self.cached = 0
+        # (time, completed) of recent emits, for the recent rate
+        self.recent = []
+
+    def add_result(self, summary):
+        if "error" in summary:
+            self.failed = self.failed+1
+        else:
+            self.completed = self.completed+1
+            if summary["cached"]:
+                self.cached = self.cached+1
+
+    def emit(self, running : int, state="running"):
+        import json
+        now = time.time()
+        self.last_emit = now
+        elapsed = now-self.start
+        self.recent = [(t,c) for t,c in self.recent if now-t < 3600]+[(now, self.completed)]
+        recent_time, recent_completed = self.recent[0]
+        done_cost = self.progress.n
+        total_cost = self.progress.total
+        eta = None
+        if done_cost > 0 and total_cost is not None:
+            eta = (total_cost-done_cost)*elapsed/done_cost
+        record = {"time" : now,
+                  "node" : self.node,
+                  "node_rank" : self.node_rank,
+                  "state" : state,
+                  "interval" : self.interval,
+                  "elapsed" : elapsed,
+                  "completed" : self.completed,
+                  "failed" : self.failed,
+                  "cached" : self.cached,
+                  "running" : running,
+                  "sims_per_hour" : 3600.0*self.completed/max(elapsed, 1e-9),
+                  "recent_sims_per_hour" : (3600.0*(self.completed-recent_completed)/
+                                            max(now-recent_time, 1e-9)) if now > recent_time else None,
+                  "result_queue_depths" : [q.qsize() for q in self.result_queues],
+                  "dp_backlog_rows" : [b.value for b in self.dp_backlogs],
+                  "memory_available" : psutil.virtual_memory().available,
+                  "memory_reserved" : self.admission.reserved(),
+                  "memory_budget" : self.admission.budget,
+                  "done_cost" : done_cost,
+                  "total_cost" : total_cost,
+                  "eta_seconds" : eta}
+        with open(self.path, "a") as telemetry_file:
+            telemetry_file.write(json.dumps(record)+"\n")
+
+    def maybe_emit(self, running : int, state="running"):
+        if time.time()-self.last_emit >= self.interval:
+            self.emit(running, state)
+
+    def timeout(self):
+        return max(0.0, self.interval-(time.time()-self.last_emit))
+
+
+def dispatch_simulations(pool, sim_function, scheduler, progress, max_inflight : int,
+                         cost_model, admission, telemetry,
+                         drain, abandon, drain_seconds : float):
+    """
+    Keep up to max_inflight simulations submitted to the pool, as long as
+    the admission controller finds memory for them, asking the scheduler
+    for the next combination whenever one finishes. Progress is counted in
+    estimated cost, so the ETA accounts for long simulations.
+    Without running simulations the sweep ends once the scheduler is
+    exhausted. Once the drain event is set nothing is submitted anymore,
+    running simulations are waited for until drain_seconds passed or the
+    abandon event is set. Returns the combinations still running then.
+    """
+    completions = queue.Queue()
+    inflight = 0
+    running = {}
+    finished = 0
+    phase_totals = {}
+    task_id = 0
+    waiting = None
+    drain_deadline = None
+    while True:
+        if drain.is_set() and drain_deadline is None:
+            drain_deadline = time.time()+drain_seconds
+            telemetry.emit(inflight, state="draining")
+        while inflight < max_inflight and drain_deadline is None:
+            combo = waiting if waiting is not None else scheduler.next_combo()
+            if combo is None:
+                break
+            if not admission.admit(combo, task_id):
+                waiting = combo
+                break
+            waiting = None
+            pool.apply_async(sim_function, (combo,),
+                             callback=lambda summary, task_id=task_id: completions.put((task_id, summary)),
+                             error_callback=lambda exc, combo=combo, task_id=task_id: completions.put(
+                                 (task_id, {**sim_summary(combo, [], []), "error" : repr(exc)})))
+            inflight = inflight+1
+            running[task_id] = combo
+            task_id = task_id+1
+        for combo in scheduler.pop_skipped():
+            progress.update(cost_model.estimate(combo))
+        telemetry.maybe_emit(inflight, "running" if drain_deadline is None else "draining")
+        if 0 == inflight and (drain_deadline is not None or scheduler.exhausted()):
+            break
+        if drain_deadline is not None and (abandon.is_set() or time.time() > drain_deadline):
+            break
+        try:
+            # Memory used by others may be freed without a simulation
+            # finishing, so retry a waiting combination now and then.
+            # Wake up every second to notice a drain
+            timeout = min(telemetry.timeout(), 1.0)
+            finished_id, summary = completions.get(timeout=timeout)
+        except queue.Empty:
+            continue
+        inflight = inflight-1
+        del running[finished_id]
+        admission.release(finished_id, summary)
+        if "error" in summary:
+            print(f"Simulation of {summary['combo']} failed: {summary['error']}")
+        scheduler.add_result(summary)
+        cost_model.record(summary)
+        telemetry.add_result(summary)
+        finished = finished+1
+        for phase,seconds in summary["phase_seconds"].items():
+            phase_totals[phase] = phase_totals.get(phase, 0.0)+seconds
+        progress.update(cost_model.estimate(summary["combo"]))
+        progress.set_postfix(sims=finished,
+                             running=inflight,
+                             reserved=f"{admission.reserved()/2**30:.1f}GiB",
+                             refresh=False)
+        sys.stdout.flush()
+    if drain.is_set():
+        scheduler.drain()
+    telemetry.emit(inflight, state="drained" if drain.is_set() else "finished")
+    if phase_totals:
+        print("Mean host seconds per simulation phase: " +
+              ", ".join(f"{phase}: {total/finished:.3f}" for phase,total in phase_totals.items()))
+    return list(running.values())
 
 
 def main():
     import functools
     import resource
     import signal
-    import sys
+    import threading
+    import numpy as np
     import tqdm
 
     import gem5.utils.multiprocessing as gem5mp
@@ -601,7 +1740,13 @@ def main():
                         help='Fetch Buffer Size in Bytes', required=True)
     parser.add_argument("--split_bytes", type=int,
                         metavar="split_bytes",
-                        help='Write gathered stats to hdf5 file after internal struct reaches this size', default=4*2**30)
+                        help='Continue in a new hdf5 file once this many bytes of stats were appended to a file', default=4*2**30)
+    parser.add_argument("--flush_bytes", type=int,
+                        metavar="flush_bytes",
+                        help='Append buffered stats to the hdf5 files once the buffer of a data-processing process reaches this size', default=64*2**20)
+    parser.add_argument("--flush_seconds", type=float,
+                        metavar="flush_seconds",
+                        help='Append buffered stats to the hdf5 files at least this often', default=10.0)
     parser.add_argument("--stat_filename", type=str,
                         metavar="stat_filename",
                         help='Base name of the hdf5 file for stats, multiple files will be called stat_filename0.h5,stat_filename1.h5, etc...', default="statfile")
@@ -615,10 +1760,131 @@ def main():
                         action=argparse.BooleanOptionalAction)
     parser.add_argument("--base_out_dir", 
                         metavar="base_out_dir", help='base directory in which hdf5 files containing sim stats will be created', default=os.getcwd())
+    parser.add_argument("--result_transport", type=str,
+                        metavar="result_transport",
+                        choices=["shm","pickle"],
+                        help='How simulation workers hand results to the data-processing processes: shared memory blocks (shm) or pickled arrays (pickle)',
+                        default="shm")
+    parser.add_argument("--stats", nargs='+', type=str,
+                        metavar="stats",
+                        help='Only collect stats matching these patterns (globs over stat paths like "system.cpu.numCycles", "re:" prefix for regular expressions, "::" to select single columns like "system.cpu.commitStats0.committedInstType::Simd*")',
+                        default=[])
+    parser.add_argument("--stats_exclude", nargs='+', type=str,
+                        metavar="stats_exclude",
+                        help='Never collect stats matching these patterns, whole subtrees are skipped (i.e "system.membus" "system.mem_ctrl")',
+                        default=[])
+    parser.add_argument("--converge", type=int,
+                        metavar="converge",
+                        help='End a simulation once this many consecutive measurements have the same cycle count (within --converge_tol), 0 runs all measurements',
+                        default=0)
+    parser.add_argument("--converge_tol", type=float,
+                        metavar="converge_tol",
+                        help='Relative tolerance for --converge',
+                        default=0.001)
+    parser.add_argument("--search", type=str,
+                        metavar="search",
+                        choices=["exhaustive","frontier"],
+                        help='exhaustive: simulate all combinations; frontier: bisect for the smallest --search_axes reaching --search_threshold efficiency',
+                        default="exhaustive")
+    parser.add_argument("--search_axes", nargs='+', type=str,
+                        metavar="search_axes",
+                        choices=combo_params,
+                        help='Parameters efficiency is monotone in, the first one is bisected (default: rob_size iq_size simd_phreg_count)',
+                        default=["rob_size","iq_size","simd_phreg_count"])
+    parser.add_argument("--search_threshold", type=float,
+                        metavar="search_threshold",
+                        help='Efficiency the frontier search looks for (default: 0.95)',
+                        default=0.95)
+    parser.add_argument("--order", type=str,
+                        metavar="order",
+                        choices=["longest_first","product"],
+                        help='(exhaustive search without pruning) Submit the longest simulations first by estimated cost, or in parameter product order',
+                        default="longest_first")
+    parser.add_argument("--prune",
+                        metavar="prune",
+                        help='(exhaustive search) Skip combinations decided by dominance in --search_axes, they are recorded in <stat_filename>pruned.csv',
+                        action=argparse.BooleanOptionalAction)
+    parser.add_argument("--prune_saturation", type=float,
+                        metavar="prune_saturation",
+                        help='Combinations with more resources than one reaching this efficiency are recorded as saturated (default: 0.99)',
+                        default=0.99)
+    parser.add_argument("--prune_hopeless", type=float,
+                        metavar="prune_hopeless",
+                        help='Combinations with fewer resources than one below this efficiency are recorded as hopeless (default: disabled)',
+                        default=None)
+    parser.add_argument("--fork_server",
+                        metavar="fork_server",
+                        help='Fork every simulation from a template process that already imported gem5 and the core models, instead of starting a new gem5 process',
+                        action=argparse.BooleanOptionalAction)
+    parser.add_argument("--mem_fraction", type=float,
+                        metavar="mem_fraction",
+                        help='Fraction of the memory available at startup the simulations may reserve (default: 0.8)',
+                        default=0.8)
+    parser.add_argument("--mem_initial", type=float,
+                        metavar="mem_initial",
+                        help='Assumed peak memory usage in GiB of a simulation before any was measured (default: 1)',
+                        default=1.0)
+    parser.add_argument("--mem_margin", type=float,
+                        metavar="mem_margin",
+                        help='Relative margin added to the measured peak memory usage of a configuration class (default: 0.2)',
+                        default=0.2)
+    parser.add_argument("--work_dir", type=str,
+                        metavar="work_dir",
+                        help='Shared directory coordinating a sweep run by several nodes with the same arguments, nodes claim batches of combinations through file leases',
+                        default=None)
+    parser.add_argument("--batch_size", type=int,
+                        metavar="batch_size",
+                        help='(--work_dir) Combinations per batch (default: 32)',
+                        default=32)
+    parser.add_argument("--node_rank", type=int,
+                        metavar="node_rank",
+                        help='(--work_dir) Index of this node, its own batches are claimed first (default: $SLURM_PROCID or 0)',
+                        default=int(os.environ.get("SLURM_PROCID", 0)))
+    parser.add_argument("--node_count", type=int,
+                        metavar="node_count",
+                        help='(--work_dir) Number of nodes (default: $SLURM_NTASKS or 1)',
+                        default=int(os.environ.get("SLURM_NTASKS", 1)))
+    parser.add_argument("--lease_timeout", type=float,
+                        metavar="lease_timeout",
+                        help='(--work_dir) Seconds after which the batches of a node that stopped renewing its leases are taken over (default: 1800)',
+                        default=1800.0)
+    parser.add_argument("--cache_dir", type=str,
+                        metavar="cache_dir",
+                        help='Directory with simulation results shared between sweeps, indexed by a fingerprint of the resolved configuration, benchmark binary and gem5 build (default: no cache)',
+                        default=None)
+    parser.add_argument("--checkpoint_dir", type=str,
+                        metavar="checkpoint_dir",
+                        help='Run the benchmark up to the first workbegin once per binary, iterations and vector length with an atomic CPU, checkpoint it here and restore it into all combinations sharing that state (default: simulate the warm-up of every combination)',
+                        default=None)
+    parser.add_argument("--telemetry", type=str,
+                        metavar="telemetry",
+                        help='JSON lines file the sweep state is appended to (default: <base_out_dir>/<stat_filename>telemetry.jsonl, with a _node<rank> suffix for --work_dir)',
+                        default=None)
+    parser.add_argument("--telemetry_seconds", type=float,
+                        metavar="telemetry_seconds",
+                        help='Seconds between telemetry records (default: 60)',
+                        default=60.0)
+    parser.add_argument("--drain_seconds", type=float,
+                        metavar="drain_seconds",
+                        help='After SIGINT/SIGTERM, wait this long for running simulations before abandoning them, a second signal abandons them right away (default: 60)',
+                        default=60.0)
+    parser.add_argument("--resume",
+                        metavar="resume",
+                        help='(exhaustive search) Skip combinations already stored in stat_filename*_dp*_*.h5 files in base_out_dir and its partition directories',
+                        action=argparse.BooleanOptionalAction)
 
 
     args = parser.parse_args()
 
+    if args.work_dir and ("frontier" == args.search or args.prune):
+        parser.error("--work_dir only supports exhaustive sweeps without --prune")
+    if args.resume and "frontier" == args.search:
+        # Skipping completed combinations would bisect incomplete lines
+        parser.error("--resume only supports exhaustive sweeps")
+    # Every node of a --work_dir campaign writes its own result and
+    # history files into the shared base_out_dir
+    node_suffix = f"_node{args.node_rank}" if args.work_dir else ""
+
 
     # Create parameter combinations
 
@@ -646,13 +1912,21 @@ def main():
     combinations = [combo for combo in combinations if max_vregs > (combo[0]*combo[1]+combo[0]*2+1)]
     print(f"Filtered out {combination_count - len(combinations)} combinations")
 
+    # The campaign of a --work_dir sweep is the same on every node, no
+    # matter what each node finds already simulated
+    campaign_combinations = combinations
+    if args.resume:
+        print(f"Looking for completed combinations in {args.base_out_dir}")
+        completed = load_completed_combos(args.base_out_dir, args.stat_filename)
+        combination_count = len(combinations)
+        combinations = [combo for combo in combinations if combo not in completed]
+        print(f"Resuming: {combination_count - len(combinations)} combinations already simulated")
+
 
     hw_cores = int(os.cpu_count())
     print(f"System has {hw_cores} hardware cores")
-    ram_per_worker = 200*2**20
-    hw_max_ram_cores = int((0.50*ram_available)/ram_per_worker)
-    print(f"System has enough memory for {hw_max_ram_cores} concurrent workers")
-    hw_cores = min(hw_cores, hw_max_ram_cores)
+    # How many simulations run at once is decided by the memory admission
+    # controller, the worker count is only bounded by the cores
     combination_count = len(combinations)
     print(f"Number of combinations: {combination_count}")
     max_workers = min(hw_cores, combination_count)
@@ -663,21 +1937,6 @@ def main():
     dp_worker_count = max(1,max_workers//sims_per_dataprocs)
     sim_worker_count = max(1,max_workers - dp_worker_count)
 
-    result_queues = [gem5Context().Queue() for i in range(dp_worker_count)]
-
-    # Ignore signals in the pool
-    signal.signal(signal.SIGINT, signal.SIG_IGN)
-    end_event = gem5Context().Event()
-    dp_processes = [gem5Context().Process(target=process_results,
-                     args=(args.stat_filename+f"_dp{i}_",
-                      args.base_out_dir,
-                      args.split_bytes,
-                      result_queues[i],
-                      end_event)) for i in range(dp_worker_count)]
-
-    for p in dp_processes:
-        p.start()
-
     # Suppress file creation
     m5.options.outdir="/dev/null"
     m5.options.no_output_files=True
@@ -695,56 +1954,216 @@ def main():
         m5.options.stderr_file="/dev/null"
         m5.options.stdout_file="/dev/null"
 
-    pool = gem5mp.Pool(processes=sim_worker_count,
-                       maxtasksperchild=1,
-                       initializer=simrun_init,
-                       initargs=(result_queues,))
-    # The previous signal call is supposed to return the "default"
-    # signal handler, but somehow it isn't a valid handler with gem5
-    # Therefore let's just set one that will terminate the program
-    # TODO: exit gracefully
-    def stop_processes_and_exit(sig,frame):
-        pool.terminate()
-        for p in dp_processes:
-            p.terminate()
-        exit(-1)
-    signal.signal(signal.SIGINT, stop_processes_and_exit)
+    if not combinations:
+        print("Nothing to simulate")
+        return
 
     os.makedirs(args.base_out_dir,exist_ok=True)
-    try:
-        for result in tqdm.tqdm(pool.imap_unordered(
-                functools.partial(
-                    simrun, isa
-                    ),
-                    combinations
-                ),
-                unit='sim',
-                desc='Simulating: ',
-                total=combination_count,
-                delay=1,
-                smoothing=0.1,
-                position=args.tqdm_position):
-            #result_queue.put(result)
-            sys.stdout.flush()
-
-    except KeyboardInterrupt:
-        print("Keyboard interrupt received, terminating pool")
-        pool.terminate()
-        print("Setting end_event")
-        end_event.set()
-        for q in result_queues:
-            q.put(pd.DataFrame())
-        for p in dp_processes:
-            p.terminate()
+
+    # All simulations of this sweep store the same columns. The schema
+    # is probed with the largest value of every parameter, as the bucket
+    # counts of distributions grow with widths and queue sizes.
+    sweep_spec = {k : sorted(set(v)) for k,v in zip(combo_params, param_lists)}
+    sweep_spec["stats"] = args.stats
+    sweep_spec["stats_exclude"] = args.stats_exclude
+    sweep_spec["converge"] = [args.converge, args.converge_tol]
+    if args.checkpoint_dir:
+        sweep_spec["restore"] = "workbegin"
+    key = schema_key(isa, sweep_spec)
+    stat_schema_path = schema_path(args.base_out_dir, args.stat_filename, key)
+    if os.path.exists(stat_schema_path):
+        print(f"Using stat schema {stat_schema_path}")
+        schema = load_schema(stat_schema_path)
+    else:
+        probe_combo = combinations[0][:2]+tuple(max(v) for v in param_lists[2:])
+        print(f"Probing stat schema with {probe_combo}")
+        with gem5mp.Pool(processes=1, maxtasksperchild=1) as probe_pool:
+            columns = probe_pool.apply(probe_stat_columns,
+                                       (isa, probe_combo,
+                                        args.stats, args.stats_exclude))
+        schema = make_schema(key, isa, sweep_spec, columns)
+        write_schema(stat_schema_path, schema)
+        print(f"Stat schema with {len(schema['columns'])} columns written to {stat_schema_path}")
+
+    sim_options = {"transport" : args.result_transport,
+                   "converge" : args.converge,
+                   "converge_tol" : args.converge_tol,
+                   "cache_dir" : args.cache_dir,
+                   "checkpoint_dir" : args.checkpoint_dir,
+                   "build_hash" : None}
+    if args.cache_dir or args.checkpoint_dir:
+        # This process is gem5, the build is identified by its executable
+        sim_options["build_hash"] = file_digest("/proc/self/exe")
+    if args.cache_dir:
+        os.makedirs(args.cache_dir, exist_ok=True)
+        print(f"Using result cache {args.cache_dir}")
+    if args.checkpoint_dir:
+        os.makedirs(args.checkpoint_dir, exist_ok=True)
+        print(f"Restoring simulations from workbegin checkpoints in {args.checkpoint_dir}")
+
+    result_queues = [gem5Context().Queue() for i in range(dp_worker_count)]
+    dp_backlogs = [gem5Context().Value('q', 0, lock=False) for i in range(dp_worker_count)]
+
+    # Ignore signals in the pool. SLURM sends SIGTERM to every process of
+    # the job, the data-processing and simulation processes inherit
+    # ignoring it, so running simulations finish and only this process
+    # reacts, see drain_on_signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    dp_processes = [gem5Context().Process(target=process_results,
+                     args=(args.stat_filename+f"_dp{i}{node_suffix}_",
+                      args.base_out_dir,
+                      args.split_bytes,
+                      schema,
+                      result_queues[i],
+                      args.flush_bytes,
+                      args.flush_seconds,
+                      dp_backlogs[i])) for i in range(dp_worker_count)]
+
+    for p in dp_processes:
+        p.start()
+
+    if args.fork_server:
+        pool = ForkServerPool(result_queues, schema, sim_options)
+    else:
+        pool = gem5mp.Pool(processes=sim_worker_count,
+                           maxtasksperchild=1,
+                           initializer=simrun_init,
+                           initargs=(result_queues,schema,sim_options))
+    # The previous signal call is supposed to return the "default"
+    # signal handler, but somehow it isn't a valid handler with gem5.
+    # The first SIGINT/SIGTERM (i.e. SLURM before the time limit) drains
+    # the sweep, a second one abandons the running simulations. Either
+    # way the data-processing processes write everything they buffered.
+    drain = threading.Event()
+    abandon = threading.Event()
+    def drain_on_signal(sig,frame):
+        if drain.is_set():
+            print(f"Received {signal.Signals(sig).name} again, abandoning running simulations")
+            abandon.set()
+        else:
+            print(f"Received {signal.Signals(sig).name}, draining: no new simulations, "
+                  f"waiting up to {args.drain_seconds}s for running ones")
+            drain.set()
+    signal.signal(signal.SIGINT, drain_on_signal)
+    signal.signal(signal.SIGTERM, drain_on_signal)
+
+    cost_model = CostModel(os.path.join(args.base_out_dir,
+                                        f"{args.stat_filename}hosttimes{node_suffix}.csv"))
+    cost_model.prime(campaign_combinations)
+    memory_budget = int(args.mem_fraction*psutil.virtual_memory().available)
+    print(f"Simulations may use up to {memory_budget/2**30:.1f} GiB")
+    admission = MemoryAdmission(os.path.join(args.base_out_dir,
+                                             f"{args.stat_filename}memory{node_suffix}.csv"),
+                                budget=memory_budget,
+                                initial_footprint=int(args.mem_initial*2**30),
+                                margin=args.mem_margin,
+                                min_free=int(0.05*ram_available))
+    progress_combinations = combinations
+    if args.work_dir:
+        # Batches in descending analytic cost, so the whole campaign runs
+        # longest first and every node agrees on the batches
+        costs = CostModel.analytic_costs(campaign_combinations)
+        ordered = [campaign_combinations[i] for i in np.argsort(-costs, kind="stable")]
+        batches = [ordered[i:i+args.batch_size] for i in range(0, len(ordered), args.batch_size)]
+        scheduler = LeaseScheduler(args.work_dir,
+                                   campaign_key=f"{key}-{args.batch_size}",
+                                   batches=batches,
+                                   node_rank=args.node_rank,
+                                   node_count=args.node_count,
+                                   lease_timeout=args.lease_timeout,
+                                   selected=set(combinations))
+        progress_combinations = campaign_combinations
+    elif "frontier" == args.search:
+        scheduler = FrontierSearch(combinations,
+                                   axes=args.search_axes,
+                                   threshold=args.search_threshold)
+    elif args.prune:
+        scheduler = PruningScheduler(combinations,
+                                     axes=args.search_axes,
+                                     saturation=args.prune_saturation,
+                                     hopeless=args.prune_hopeless,
+                                     pruned_path=os.path.join(args.base_out_dir,
+                                                              f"{args.stat_filename}pruned.csv"),
+                                     window=4*sim_worker_count)
+    elif "longest_first" == args.order:
+        scheduler = SweepScheduler(sorted(combinations,
+                                          key=cost_model.estimate,
+                                          reverse=True))
+    else:
+        scheduler = SweepScheduler(combinations)
+
+    with tqdm.tqdm(unit='cost',
+                   unit_scale=True,
+                   desc='Simulating: ',
+                   total=sum(cost_model.estimate(c) for c in progress_combinations),
+                   delay=1,
+                   smoothing=0.1,
+                   position=args.tqdm_position) as progress:
+        telemetry_path = args.telemetry
+        if telemetry_path is None:
+            telemetry_path = os.path.join(args.base_out_dir,
+                                          f"{args.stat_filename}telemetry{node_suffix}.jsonl")
+        telemetry = Telemetry(telemetry_path,
+                              interval=args.telemetry_seconds,
+                              node_rank=args.node_rank,
+                              result_queues=result_queues,
+                              dp_backlogs=dp_backlogs,
+                              admission=admission,
+                              progress=progress)
+        abandoned = dispatch_simulations(pool,
+                                         functools.partial(simrun, isa),
+                                         scheduler,
+                                         progress,
+                                         max_inflight=sim_worker_count,
+                                         cost_model=cost_model,
+                                         admission=admission,
+                                         telemetry=telemetry,
+                                         drain=drain,
+                                         abandon=abandon,
+                                         drain_seconds=args.drain_seconds)
+
+    if "frontier" == args.search:
+        if drain.is_set():
+            print("Sweep was drained, the frontier is incomplete")
+        simulated_count = len(scheduler.simulated)
+        print(f"Simulated {simulated_count} of {combination_count} combinations "
+              f"({100.0*simulated_count/combination_count:.1f}%)")
+        if scheduler.failed:
+            print(f"{len(scheduler.failed)} simulations failed and are not part of the frontier:")
+            for combo in scheduler.failed:
+                print(dict(zip(combo_params, combo)))
+        frontier = scheduler.frontier()
+        frontier_path = os.path.join(args.base_out_dir,
+                                     f"{args.stat_filename}frontier.csv")
+        write_frontier(frontier_path, frontier)
+        print(f"{len(frontier)} frontier configurations reaching "
+              f"efficiency >= {args.search_threshold} written to {frontier_path}")
+        for combo, efficiency in sorted(frontier):
+            print(dict(zip(combo_params, combo)), efficiency)
+
+    if abandoned:
+        print(f"Terminating pool, abandoning {len(abandoned)} running simulations:")
+        for combo in abandoned:
+            print(dict(zip(combo_params, combo)))
+        terminate_pool(pool)
     else:
         pool.close()
-        print("Setting end_event")
-        end_event.set()
-        for q in result_queues:
-            q.put(pd.DataFrame())
-        for p in dp_processes:
-            p.join()
+    # Every simulation sent its records before it exited, this process
+    # is the only producer of the sentinel that ends data processing
     pool.join()
+    print("Ending data processing")
+    for q in result_queues:
+        q.put(None)
+    # Every buffered result is appended to the stat stores and the
+    # completed index before the data-processing processes exit
+    for p in dp_processes:
+        p.join()
+    if drain.is_set():
+        if "frontier" == args.search:
+            print("Drained, the frontier search has to be run again")
+        else:
+            print("Drained, continue the sweep with --resume")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+"""
+Content-addressed cache of simulation results shared between sweeps of
+multi-isa-nanogemm.py
+"""
+
+import os
+
+
+def file_digest(path : str):
+    import hashlib
+    digest = hashlib.sha256()
+    with open(path, "rb") as digest_file:
+        for block in iter(lambda: digest_file.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def config_fingerprint(root, binary : str, build_hash : str, options : dict):
+    """
+    Identifies the result of a simulation independent of the sweep it is
+    part of: the resolved params of all SimObjects (only available after
+    m5.instantiate() or resolve_params()), the benchmark binary and gem5
+    build by content and the options that change which measurements are
+    taken. Paths of the checkout don't change the fingerprint.
+    """
+    import hashlib
+    import json
+
+    def without_cwd(config):
+        # The working directory of the simulated process is a path of
+        # the checkout, too
+        if isinstance(config, dict):
+            return {k : without_cwd(v) for k,v in config.items() if "cwd" != k}
+        if isinstance(config, list):
+            return [without_cwd(v) for v in config]
+        return config
+
+    binary_path = os.path.realpath(binary)
+    spec = {"config" : without_cwd(root.get_config_as_dict()),
+            "converge" : [options["converge"], options["converge_tol"]]}
+    if options["checkpoint_dir"]:
+        # Warm-up wasn't simulated in detail
+        spec["restore"] = "workbegin"
+    spec = json.dumps(spec, sort_keys=True, default=str)
+    spec = spec.replace(binary_path, "<binary>").replace(binary, "<binary>")
+    spec = spec+file_digest(binary_path)+build_hash
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+def cache_entry_path(cache_dir : str, fingerprint : str):
+    return os.path.join(cache_dir, fingerprint[:2], f"{fingerprint}.npz")
+
+def load_cached_result(cache_dir : str, fingerprint : str, columns : list):
+    """
+    Records (column x row) in the order of columns and the measurement
+    history of a cached simulation, None if it isn't cached or doesn't
+    have all the columns
+    """
+    import json
+    import numpy as np
+    entry_path = cache_entry_path(cache_dir, fingerprint)
+    if not os.path.exists(entry_path):
+        return None
+    with np.load(entry_path) as entry:
+        cached_index = {c : i for i,c in enumerate(entry["columns"].tolist())}
+        if any(c not in cached_index for c in columns):
+            return None
+        records = entry["records"][[cached_index[c] for c in columns],:]
+        history = json.loads(str(entry["history"]))
+    return records, history
+
+def store_cached_result(cache_dir : str, fingerprint : str, columns : list,
+                        records, history : dict):
+    import json
+    import numpy as np
+    entry_path = cache_entry_path(cache_dir, fingerprint)
+    os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+    tmp_path = f"{entry_path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path,
+             columns=np.array(columns),
+             records=records,
+             history=np.array(json.dumps(history)))
+    os.replace(tmp_path, entry_path)
@@ -0,0 +1,507 @@
+"""
+Schedulers deciding which combinations of a multi-isa-nanogemm.py sweep
+are simulated, and in which order
+"""
+
+import csv
+import os
+import time
+
+from .stat_store import combo_params
+
+
+def dominates(combo, other, axes_idx : list):
+    # combo has at least the resources of other in every axis
+    return all(combo[i] >= other[i] for i in axes_idx)
+
+
+class SweepScheduler:
+    """
+    Hands out all combinations in the given order.
+    Schedulers are driven by dispatch_simulations: next_combo() returns
+    the next combination to simulate or None if nothing can be submitted
+    right now, add_result() receives the summary simrun returned and
+    pop_skipped() the combinations decided without simulating since the
+    last call. The sweep ends once nothing is running and exhausted()
+    says that next_combo() won't return anything anymore.
+    """
+    def __init__(self, combinations):
+        self.pending = list(reversed(combinations))
+
+    def next_combo(self):
+        if self.pending:
+            return self.pending.pop()
+        return None
+
+    def add_result(self, summary):
+        pass
+
+    def pop_skipped(self):
+        return []
+
+    def exhausted(self):
+        # Only results of running simulations make more combinations
+        # available
+        return True
+
+    def drain(self):
+        # Called once no more combinations will be taken
+        pass
+
+
+class PruningScheduler(SweepScheduler):
+    """
+    Exhaustive sweep that exploits efficiency being monotone in the
+    resource axes. A configuration with at least the resources of one that
+    reached saturation is recorded as saturated, one with at most the
+    resources of a hopeless one (efficiency below hopeless) as hopeless,
+    both without simulating. The largest configuration of every group is
+    simulated first, then the rest in ascending order of resources,
+    preferring configurations no running simulation can decide.
+    """
+    def __init__(self, combinations, axes : list,
+                 saturation : float, hopeless : float,
+                 pruned_path : str, window : int):
+        self.axes_idx = [combo_params.index(a) for a in axes]
+        self.saturation = saturation
+        self.hopeless = hopeless
+        self.window = window
+        axis_values = [sorted(set(c[i] for c in combinations)) for i in self.axes_idx]
+        def rank(combo):
+            return sum(values.index(combo[i]) for values,i in zip(axis_values,self.axes_idx))
+        groups = {}
+        for combo in combinations:
+            groups.setdefault(self.group_key(combo), []).append(combo)
+        corners = [max(combos, key=rank) for combos in groups.values()]
+        corner_set = set(corners)
+        rest = sorted((c for c in combinations if c not in corner_set), key=rank)
+        self.pending = corners+rest
+        self.taken = set()
+        self.head = 0
+        # Running simulations per group of non-axis parameters
+        self.running = {}
+        # Per group: smallest saturated and largest hopeless simulated
+        # configurations as (combo, efficiency)
+        self.saturated = {}
+        self.hopeless_points = {}
+        self.skipped = []
+        write_header = not os.path.exists(pruned_path)
+        self.pruned_file = open(pruned_path, "a", newline='')
+        self.pruned_writer = csv.writer(self.pruned_file)
+        if write_header:
+            self.pruned_writer.writerow(combo_params+["status","efficiency","decided_by"])
+
+    def group_key(self, combo):
+        return tuple(v for i,v in enumerate(combo) if i not in self.axes_idx)
+
+    def decision(self, combo):
+        # (status, efficiency, decided_by) if implied by a simulated configuration
+        key = self.group_key(combo)
+        for other, efficiency in self.saturated.get(key, []):
+            if dominates(combo, other, self.axes_idx):
+                return ("saturated", efficiency, other)
+        for other, efficiency in self.hopeless_points.get(key, []):
+            if dominates(other, combo, self.axes_idx):
+                return ("hopeless", efficiency, other)
+        return None
+
+    def may_be_decided_by_running(self, combo):
+        for other in self.running.get(self.group_key(combo), []):
+            if dominates(combo, other, self.axes_idx):
+                return True
+            if self.hopeless is not None and dominates(other, combo, self.axes_idx):
+                return True
+        return False
+
+    def add_point(self, points : list, combo, efficiency, minimal : bool):
+        # Keep only the minimal (or maximal) configurations of points
+        def covers(a, b):
+            return dominates(b, a, self.axes_idx) if minimal else dominates(a, b, self.axes_idx)
+        if any(covers(other, combo) for other,_ in points):
+            return
+        points[:] = [(other, e) for other,e in points if not covers(combo, other)]
+        points.append((combo, efficiency))
+
+    def record_pruned(self, combo, decision):
+        status, efficiency, other = decision
+        self.pruned_writer.writerow(list(combo)+[status, efficiency, " ".join(str(v) for v in other)])
+        self.pruned_file.flush()
+        self.skipped.append(combo)
+
+    def take(self, position):
+        combo = self.pending[position]
+        self.taken.add(position)
+        while self.head in self.taken:
+            self.taken.remove(self.head)
+            self.head = self.head+1
+        return combo
+
+    def next_combo(self):
+        fallback = None
+        position = self.head
+        scanned = 0
+        while position < len(self.pending) and scanned < self.window:
+            if position in self.taken:
+                position = position+1
+                continue
+            combo = self.pending[position]
+            decision = self.decision(combo)
+            if decision is not None:
+                self.take(position)
+                self.record_pruned(combo, decision)
+            elif not self.may_be_decided_by_running(combo):
+                self.running.setdefault(self.group_key(combo), set()).add(combo)
+                return self.take(position)
+            else:
+                if fallback is None:
+                    fallback = position
+                scanned = scanned+1
+            position = position+1
+        if fallback is None:
+            return None
+        # Better to simulate something that might have been pruned than
+        # to leave workers idle
+        combo = self.pending[fallback]
+        self.running.setdefault(self.group_key(combo), set()).add(combo)
+        return self.take(fallback)
+
+    def add_result(self, summary):
+        combo = summary["combo"]
+        key = self.group_key(combo)
+        self.running[key].discard(combo)
+        efficiency = summary["efficiency"]
+        if efficiency is None:
+            return
+        if efficiency >= self.saturation:
+            self.add_point(self.saturated.setdefault(key, []), combo, efficiency, minimal=True)
+        elif self.hopeless is not None and efficiency < self.hopeless:
+            self.add_point(self.hopeless_points.setdefault(key, []), combo, efficiency, minimal=False)
+
+    def pop_skipped(self):
+        skipped = self.skipped
+        self.skipped = []
+        return skipped
+
+
+class FrontierSearch(SweepScheduler):
+    """
+    Find the smallest resources reaching an efficiency threshold without
+    simulating the whole grid. Efficiency is assumed to be monotone
+    non-decreasing in every axis. Each line along the first axis (all
+    other parameters fixed) is bisected for its first passing value, and
+    results already known from dominating or dominated configurations
+    are used instead of simulating. Failed simulations are left out of
+    their line instead of counting as below the threshold.
+    """
+    def __init__(self, combinations, axes : list, threshold : float):
+        self.axes_idx = [combo_params.index(a) for a in axes]
+        self.bisect_idx = self.axes_idx[0]
+        self.threshold = threshold
+        self.simulated = {}
+        self.failed = []
+        # Simulated (combo, passed) per group of non-axis parameters
+        self.group_results = {}
+        line_combos = {}
+        for combo in combinations:
+            line_combos.setdefault(self.line_key(combo), []).append(combo)
+        self.lines = []
+        self.combo_line = {}
+        for combos in line_combos.values():
+            combos.sort(key=lambda c: c[self.bisect_idx])
+            line = {"combos" : combos, "lo" : 0, "hi" : len(combos), "busy" : False}
+            self.lines.append(line)
+            for combo in combos:
+                self.combo_line[combo] = line
+        self.next_line = 0
+
+    def line_key(self, combo):
+        return tuple(v for i,v in enumerate(combo) if i != self.bisect_idx)
+
+    def group_key(self, combo):
+        return tuple(v for i,v in enumerate(combo) if i not in self.axes_idx)
+
+    def known_pass(self, combo):
+        # True/False if implied by a simulated configuration, None otherwise
+        for other, passed in self.group_results.get(self.group_key(combo), []):
+            if passed and dominates(combo, other, self.axes_idx):
+                return True
+            if not passed and dominates(other, combo, self.axes_idx):
+                return False
+        return None
+
+    def update_line(self, line, mid, passed):
+        if passed:
+            line["hi"] = mid
+        else:
+            line["lo"] = mid+1
+
+    def next_combo(self):
+        for _ in range(len(self.lines)):
+            line = self.lines[self.next_line]
+            self.next_line = (self.next_line+1)%len(self.lines)
+            while not line["busy"] and line["lo"] < line["hi"]:
+                mid = (line["lo"]+line["hi"])//2
+                combo = line["combos"][mid]
+                passed = self.known_pass(combo)
+                if passed is None:
+                    line["busy"] = True
+                    return combo
+                self.update_line(line, mid, passed)
+        return None
+
+    def add_result(self, summary):
+        combo = summary["combo"]
+        efficiency = summary["efficiency"]
+        line = self.combo_line[combo]
+        line["busy"] = False
+        mid = line["combos"].index(combo)
+        if "error" in summary or efficiency is None:
+            # Says nothing about the threshold, so it must not decide
+            # other configurations. The line is bisected without it
+            self.failed.append(combo)
+            del line["combos"][mid]
+            line["hi"] = line["hi"]-1
+            return
+        passed = efficiency >= self.threshold
+        self.simulated[combo] = efficiency
+        self.group_results.setdefault(self.group_key(combo), []).append((combo, passed))
+        self.update_line(line, mid, passed)
+
+    def frontier(self):
+        """
+        Pareto-minimal configurations reaching the threshold, per group of
+        non-axis parameters, with their efficiency if it was simulated
+        """
+        group_points = {}
+        for line in self.lines:
+            if line["hi"] < len(line["combos"]):
+                combo = line["combos"][line["hi"]]
+                group_points.setdefault(self.group_key(combo), []).append(combo)
+        frontier = []
+        for points in group_points.values():
+            for combo in points:
+                dominated = any(other != combo and
+                                dominates(combo, other, self.axes_idx)
+                                for other in points)
+                if not dominated:
+                    frontier.append((combo, self.simulated.get(combo)))
+        return frontier
+
+
+def write_frontier(path : str, frontier : list):
+    with open(path, "w", newline='') as frontier_file:
+        writer = csv.writer(frontier_file)
+        writer.writerow(combo_params+["efficiency"])
+        for combo, efficiency in sorted(frontier):
+            writer.writerow(list(combo)+["" if efficiency is None else efficiency])
+
+
+class LeaseScheduler(SweepScheduler):
+    """
+    Coordinates a sweep over several nodes through a shared directory,
+    without any other service. The campaign is split into batches that
+    are published once as files in <work_dir>/campaign/todo. A node claims
+    a batch by renaming it into leases/ with its name appended, which only
+    one node can succeed in, and moves it to done/ once all simulations of
+    the batch finished. Every node prefers the batches of its own slice
+    (batch index modulo node count), then takes the remaining batches of
+    the other slices and finally batches whose lease was not renewed for
+    lease_timeout seconds, as their node died. A node waits for the
+    leases of the other nodes, it only stops once todo/ and leases/ are
+    both empty, so the batches of a node that died are always taken over.
+    Batches finished by other nodes and combinations not in selected
+    (i.e. already simulated) are reported as skipped, so the progress bar
+    shows the progress of the whole campaign.
+    """
+    def __init__(self, work_dir : str, campaign_key : str, batches : list,
+                 node_rank : int, node_count : int, lease_timeout : float,
+                 selected : set):
+        import json
+        import socket
+        import threading
+
+        self.owner = f"{socket.gethostname()}-{os.getpid()}"
+        self.campaign_dir = os.path.join(work_dir, "campaign")
+        self.todo_dir = os.path.join(self.campaign_dir, "todo")
+        self.lease_dir = os.path.join(self.campaign_dir, "leases")
+        self.done_dir = os.path.join(self.campaign_dir, "done")
+        self.node_rank = node_rank
+        self.node_count = node_count
+        self.lease_timeout = lease_timeout
+        self.selected = selected
+
+        if not os.path.exists(self.campaign_dir):
+            # Stage the complete campaign and publish it with a single
+            # rename, that fails if another node was faster
+            staging_dir = os.path.join(work_dir, f"staging.{self.owner}")
+            for d in ["todo","leases","done"]:
+                os.makedirs(os.path.join(staging_dir, d))
+            for i,batch in enumerate(batches):
+                with open(os.path.join(staging_dir, "todo", self.batch_name(i)), "w") as batch_file:
+                    json.dump(batch, batch_file)
+            with open(os.path.join(staging_dir, "campaign.json"), "w") as campaign_file:
+                json.dump({"key" : campaign_key, "batches" : len(batches)}, campaign_file)
+            try:
+                os.rename(staging_dir, self.campaign_dir)
+                print(f"Published campaign {campaign_key} with {len(batches)} batches in {self.campaign_dir}")
+            except OSError:
+                import shutil
+                shutil.rmtree(staging_dir)
+        with open(os.path.join(self.campaign_dir, "campaign.json")) as campaign_file:
+            campaign = json.load(campaign_file)
+        if campaign["key"] != campaign_key:
+            raise RuntimeError(f"{self.campaign_dir} belongs to campaign {campaign['key']}, "
+                               f"this sweep is {campaign_key}")
+
+        # Batch name -> lease path, combinations not yet finished
+        self.leases = {}
+        self.remaining = {}
+        self.batch_of = {}
+        self.pending = []
+        self.counted = set()
+        self.last_count = 0.0
+        self.skipped = []
+        self.waiting = False
+        self.lock = threading.Lock()
+        self.heartbeat = threading.Thread(target=self.renew_leases, daemon=True)
+        self.heartbeat.start()
+
+    @staticmethod
+    def batch_name(index : int):
+        return f"batch{index:06d}.json"
+
+    @staticmethod
+    def batch_index(name : str):
+        return int(name[len("batch"):].split(".")[0])
+
+    def lease_path(self, name : str, owner : str):
+        return os.path.join(self.lease_dir, f"{name}@{owner}")
+
+    def renew_leases(self):
+        while True:
+            time.sleep(self.lease_timeout/4)
+            with self.lock:
+                leases = list(self.leases.items())
+            for name,path in leases:
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    # Taken over by another node, the simulations still
+                    # running here only produce duplicate results
+                    print(f"Lost lease on {name}")
+                    with self.lock:
+                        self.leases.pop(name, None)
+
+    def claim(self):
+        """
+        Take the next batch: own slice first, then other slices, then
+        expired leases. Returns False when nothing is left to claim.
+        """
+        import json
+
+        todo = sorted(os.listdir(self.todo_dir), key=self.batch_index)
+        own = [n for n in todo if self.node_rank == self.batch_index(n)%self.node_count]
+        others = [n for n in todo if self.node_rank != self.batch_index(n)%self.node_count]
+        candidates = [(os.path.join(self.todo_dir, n), n) for n in own+others]
+        now = time.time()
+        for lease in sorted(os.listdir(self.lease_dir)):
+            name, owner = lease.split("@", 1)
+            if owner == self.owner:
+                continue
+            path = os.path.join(self.lease_dir, lease)
+            try:
+                if now-os.stat(path).st_mtime > self.lease_timeout:
+                    candidates.append((path, name))
+            except FileNotFoundError:
+                pass
+
+        for path, name in candidates:
+            lease_path = self.lease_path(name, self.owner)
+            try:
+                os.rename(path, lease_path)
+            except FileNotFoundError:
+                continue
+            if path.startswith(self.lease_dir):
+                print(f"Took over expired lease on {name}")
+            os.utime(lease_path)
+            with open(lease_path) as batch_file:
+                batch = [tuple(combo) for combo in json.load(batch_file)]
+            with self.lock:
+                self.leases[name] = lease_path
+            self.counted.add(name)
+            todo = [combo for combo in batch if combo in self.selected]
+            self.skipped.extend(combo for combo in batch if combo not in self.selected)
+            self.remaining[name] = len(todo)
+            for combo in todo:
+                self.batch_of[combo] = name
+            self.pending = list(reversed(todo))
+            if not todo:
+                self.finish(name)
+            return True
+        return False
+
+    def finish(self, name : str):
+        with self.lock:
+            lease_path = self.leases.pop(name, None)
+        del self.remaining[name]
+        if lease_path is None:
+            return
+        try:
+            os.rename(lease_path, os.path.join(self.done_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def drain(self):
+        # Hand unfinished batches back right away instead of letting other
+        # nodes wait for the leases to expire. Their finished simulations
+        # are simulated again by the node taking them over
+        with self.lock:
+            leases = list(self.leases.items())
+            self.leases = {}
+        for name,lease_path in leases:
+            try:
+                os.rename(lease_path, os.path.join(self.todo_dir, name))
+                print(f"Returned {name}")
+            except FileNotFoundError:
+                pass
+        self.pending = []
+
+    def count_finished_elsewhere(self):
+        import json
+        if time.time()-self.last_count < 60:
+            return
+        self.last_count = time.time()
+        for name in os.listdir(self.done_dir):
+            if name in self.counted:
+                continue
+            self.counted.add(name)
+            with open(os.path.join(self.done_dir, name)) as batch_file:
+                self.skipped.extend(tuple(combo) for combo in json.load(batch_file))
+
+    def next_combo(self):
+        while not self.pending:
+            if not self.claim():
+                return None
+        self.waiting = False
+        return self.pending.pop()
+
+    def exhausted(self):
+        # Leases of other nodes end in done/ or expire and are claimed
+        if not os.listdir(self.todo_dir) and not os.listdir(self.lease_dir):
+            return True
+        if not self.waiting:
+            self.waiting = True
+            print("Waiting for the leases of other nodes to finish or expire")
+        return False
+
+    def add_result(self, summary):
+        name = self.batch_of.pop(summary["combo"])
+        self.remaining[name] -= 1
+        if 0 == self.remaining[name]:
+            self.finish(name)
+
+    def pop_skipped(self):
+        self.count_finished_elsewhere()
+        skipped = self.skipped
+        self.skipped = []
+        return skipped
@@ -0,0 +1,227 @@
+"""
+Stat stores of multi-isa-nanogemm.py: appendable HDF5 files with the rows
+of all simulations of a partition, and the completed index next to them
+that --resume reads. analysis.data_extraction reads the stores.
+"""
+
+import csv
+import glob
+import os
+
+
+# Order of the parameters in a combination tuple, as produced by
+# itertools.product in main()
+combo_params = ["mr","nr",
+                "simd_lat","simd_count","simd_width","simd_phreg_count",
+                "ld_count","st_count",
+                "l1_size",
+                "iq_size","rob_size",
+                "assoc",
+                "decode_width","commit_width",
+                "fetch_buf_size"]
+
+
+# Results are stored in one directory per combination of these
+# parameters, i.e. <base_out_dir>/simd_width=512/simd_count=2/
+partition_params = ["simd_width","simd_count"]
+
+# Columns of the indexed params table of a stat file, the first columns
+# of every schema
+stored_params = combo_params+["run"]
+
+# Per simulation columns that are neither parameters nor gem5 stats.
+# cache_hit is 1 in the rows taken from the result cache, their host
+# columns are NaN. Schemas written before it existed don't have it.
+meta_columns = ["measurements", "cache_hit"]
+
+def partition_dir(out_dir : str, partition):
+    return os.path.join(out_dir, *[f"{k}={v}" for k,v in zip(partition_params, partition)])
+
+
+def create_stat_store(h5_filepath : str, schema : dict):
+    """
+    Appendable stat file: the rows of all simulations in the float64
+    array /gem5stats/values, the column names and dtypes of the schema in
+    /gem5stats/columns and /gem5stats/dtypes. pandas' table format would
+    store the column names in an HDF5 attribute, which is limited to 64 KiB.
+    Distribution buckets are kept out of the values in the uint32 array
+    /gem5stats/dists, the buckets of /gem5stats/dist_names[i] are the
+    columns dist_offsets[i]:dist_offsets[i+1].
+    The parameters and run of every row are duplicated in the indexed
+    table /gem5stats/params, so selections can be evaluated on disk and
+    only the matching rows of the values read.
+    """
+    import numpy as np
+    import tables
+
+    value_count = schema["value_count"]
+    filters = tables.Filters(complevel=4, complib="blosc:zstd")
+    with tables.open_file(h5_filepath, mode="w") as h5file:
+        group = h5file.create_group("/", "gem5stats")
+        params = h5file.create_table(group, "params",
+                                     {p : tables.Int64Col(pos=i)
+                                      for i,p in enumerate(stored_params)},
+                                     filters=filters)
+        for p in stored_params:
+            params.cols._f_col(p).create_index()
+        h5file.create_array(group, "columns",
+                            np.array(schema["columns"][:value_count], dtype=bytes))
+        h5file.create_array(group, "dtypes",
+                            np.array(schema["dtypes"][:value_count], dtype=bytes))
+        h5file.create_earray(group, "values",
+                             atom=tables.Float64Atom(),
+                             shape=(0, value_count),
+                             filters=filters,
+                             chunkshape=(64, min(value_count, 512)))
+        if schema["dists"]:
+            names, counts = zip(*schema["dists"])
+            h5file.create_array(group, "dist_names", np.array(names, dtype=bytes))
+            h5file.create_array(group, "dist_offsets",
+                                np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+            h5file.create_earray(group, "dists",
+                                 atom=tables.UInt32Atom(),
+                                 shape=(0, sum(counts)),
+                                 filters=filters,
+                                 chunkshape=(64, min(sum(counts), 1024)))
+        group._v_attrs.schema_key = schema["key"]
+
+def append_stat_store(h5_filepath : str, schema : dict, records):
+    # records is (column x row) like the buffers of process_results. The
+    # file is closed after every append, so a crash only loses the buffer
+    import numpy as np
+    import tables
+    value_count = schema["value_count"]
+    with tables.open_file(h5_filepath, mode="a") as h5file:
+        h5file.root.gem5stats.values.append(records[:value_count].T)
+        if "params" in h5file.root.gem5stats:
+            # The indexes are updated by the append
+            h5file.root.gem5stats.params.append(
+                np.rec.fromarrays(records[:len(stored_params)].astype(np.int64),
+                                  names=stored_params))
+        if schema["dists"]:
+            buckets = records[value_count:]
+            limit = np.iinfo(np.uint32).max
+            if buckets.size and buckets.max() > limit:
+                print(f"Distribution bucket counts above {limit} in {h5_filepath} are saturated")
+                buckets = np.minimum(buckets, limit)
+            h5file.root.gem5stats.dists.append(buckets.T.astype(np.uint32))
+
+def compact_stat_store(h5_filepath : str, block_rows=4096):
+    """
+    Move the stat columns that are constant over all rows of a finished
+    stat file (unused FUs, membus stats in SE mode, ...) into a manifest:
+    their names, values and dtypes are stored once in
+    /gem5stats/constant_columns, constant_values and constant_dtypes, and
+    the file is rewritten without them. Parameters and meta columns are
+    always kept.
+    """
+    import numpy as np
+    import tables
+
+    with tables.open_file(h5_filepath, mode="r") as h5file:
+        group = h5file.root.gem5stats
+        values = group.values
+        row_count = values.nrows
+        if 0 == row_count or "constant_columns" in group:
+            return
+        first = values[0]
+        constant = np.ones(values.shape[1], dtype=bool)
+        for start in range(0, row_count, block_rows):
+            block = values[start:start+block_rows]
+            constant &= np.all((block == first) | (np.isnan(block) & np.isnan(first)), axis=0)
+        columns = group.columns.read()
+        dtypes = group.dtypes.read()
+        # By name, schemas written before a meta column existed don't have it
+        constant &= ~np.isin(columns, np.array(stored_params+meta_columns, dtype=bytes))
+        if not constant.any():
+            return
+        keep = ~constant
+
+        tmp_filepath = h5_filepath+".tmp"
+        filters = tables.Filters(complevel=4, complib="blosc:zstd")
+        with tables.open_file(tmp_filepath, mode="w") as compact_file:
+            compact_group = compact_file.create_group("/", "gem5stats")
+            compact_file.create_array(compact_group, "columns", columns[keep])
+            compact_file.create_array(compact_group, "dtypes", dtypes[keep])
+            compact_values = compact_file.create_earray(compact_group, "values",
+                                                        atom=tables.Float64Atom(),
+                                                        shape=(0, int(keep.sum())),
+                                                        filters=filters,
+                                                        chunkshape=(64, min(int(keep.sum()), 512)))
+            for start in range(0, row_count, block_rows):
+                compact_values.append(values[start:start+block_rows][:,keep])
+            compact_file.create_array(compact_group, "constant_columns", columns[constant])
+            compact_file.create_array(compact_group, "constant_values", first[constant])
+            compact_file.create_array(compact_group, "constant_dtypes", dtypes[constant])
+            for name in ["dist_names","dist_offsets","dists"]:
+                if name in group:
+                    h5file.copy_node(group._f_get_child(name), newparent=compact_group)
+            if "params" in group:
+                h5file.copy_node(group.params, newparent=compact_group, propindexes=True)
+            compact_group._v_attrs.schema_key = group._v_attrs.schema_key
+    os.replace(tmp_filepath, h5_filepath)
+    print(f"Moved {int(constant.sum())} constant columns of {h5_filepath} into its manifest")
+
+def completed_index_path(h5_filepath : str):
+    return h5_filepath[:-len(".h5")]+".done.csv"
+
+def write_completed_index(h5_filepath : str, stat_df):
+    # Sidecar next to the hdf5 file listing the combinations it contains,
+    # so --resume doesn't have to load gigabytes of stats to find them.
+    # Only written after the hdf5 file itself is complete
+    combos = stat_df[combo_params].drop_duplicates()
+    index_path = completed_index_path(h5_filepath)
+    tmp_path = index_path+".tmp"
+    combos.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, index_path)
+
+def append_completed_index(h5_filepath : str, combos):
+    # Called after the records of combos (param x row) were appended to
+    # the stat file
+    index_path = completed_index_path(h5_filepath)
+    write_header = not os.path.exists(index_path)
+    with open(index_path, "a", newline='') as index_file:
+        writer = csv.writer(index_file)
+        if write_header:
+            writer.writerow(combo_params)
+        writer.writerows(sorted(set(tuple(int(v) for v in combo) for combo in combos.T)))
+
+def load_completed_combos(out_dir : str, stat_filename : str):
+    from analysis.data_extraction import read_statfile
+
+    completed = set()
+    # Stat files are in partition directories, or directly in out_dir
+    # when written by older versions
+    pattern = os.path.join(glob.escape(out_dir), "**",
+                           f"{glob.escape(stat_filename)}_dp*_*.h5")
+    for h5_filepath in sorted(glob.glob(pattern, recursive=True)):
+        index_path = completed_index_path(h5_filepath)
+        if not os.path.exists(index_path):
+            # Written before sidecars existed (or the sidecar was lost),
+            # recreate it from the file itself
+            print(f"No completed index for {h5_filepath}, reading stats")
+            try:
+                stat_df = read_statfile(h5_filepath, columns=combo_params)
+            except Exception as exc:
+                print(f"Skipping unreadable {h5_filepath}: {exc}")
+                continue
+            write_completed_index(h5_filepath, stat_df)
+            del stat_df
+        with open(index_path, newline='') as index_file:
+            reader = csv.reader(index_file)
+            header = next(reader)
+            if header != combo_params:
+                raise RuntimeError(f"Unexpected header in {index_path}: {header}")
+            completed.update(tuple(int(float(v)) for v in row) for row in reader)
+
+    # Combinations decided by dominance pruning count as completed, too
+    pruned_path = os.path.join(out_dir, f"{stat_filename}pruned.csv")
+    if os.path.exists(pruned_path):
+        with open(pruned_path, newline='') as pruned_file:
+            reader = csv.reader(pruned_file)
+            header = next(reader)
+            if header[:len(combo_params)] != combo_params:
+                raise RuntimeError(f"Unexpected header in {pruned_path}: {header}")
+            completed.update(tuple(int(v) for v in row[:len(combo_params)])
+                             for row in reader if len(row) > len(combo_params))
+    return completed
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The analysis and sweep modules are imported from the gem5-workbench
+# directory, like the gem5 configs do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
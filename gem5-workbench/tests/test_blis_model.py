@@ -0,0 +1,58 @@
+import itertools
+import math
+
+import numpy
+
+from analysis import blis_model
+
+
+def scalar_blocking(mr, nr, simd_width, l1_size, l1_assoc, l2_size, l2_assoc,
+                    l3_size, l3_assoc, cl=64, data_size=8, max_vregs=32):
+    # The per-configuration loop the configs used before the model was
+    # vectorized, extended by mc and nc
+    b_regs = max_vregs-mr*nr-2*mr
+    unroll = abs(b_regs*nr)//math.gcd(b_regs, nr)//nr
+    if 3 > unroll:
+        unroll = 4
+    if 4 == unroll:
+        unroll = 8
+    if 6 == unroll:
+        unroll = 12
+    nl = l1_size/l1_assoc/cl
+    mr_elem = mr*simd_width/(data_size*8)
+    ca = max(1, int(math.floor((l1_assoc-1.0)/(1.0+nr/mr_elem))))
+    kc = int((ca*nl*cl)/(mr_elem*data_size))
+
+    l2_way = l2_size/l2_assoc
+    cb_l2 = math.ceil(nr*kc*data_size/l2_way)
+    mc = int(max(0, l2_assoc-1-cb_l2)*l2_way/(kc*data_size))
+    mc = int(mc//mr_elem*mr_elem)
+    l3_way = l3_size/l3_assoc
+    ca_l3 = math.ceil(mc*kc*data_size/l3_way)
+    nc = int(max(0, l3_assoc-1-ca_l3)*l3_way/(kc*data_size))
+    nc = nc//nr*nr
+    return {"unroll" : unroll, "iterations" : kc//unroll, "kc" : kc, "ca" : ca,
+            "mc" : mc, "nc" : nc}
+
+def test_blocking_matches_scalar_loop():
+    points = [p for p in itertools.product(range(1, 9), range(1, 13), [128, 256, 512],
+                                           [32*1024, 64*1024], [4, 8])
+              if 32 > p[0]*p[1]+2*p[0]+1]
+    l2_size, l2_assoc = 1024*1024, 16
+    l3_size, l3_assoc = 8*1024*1024, 16
+    mr, nr, simd_width, l1_size, l1_assoc = (numpy.array(v) for v in zip(*points))
+    model = blis_model.blocking(mr, nr, simd_width,
+                                l1_sets=blis_model.cache_sets(l1_size, l1_assoc),
+                                l1_assoc=l1_assoc,
+                                l2_sets=blis_model.cache_sets(l2_size, l2_assoc),
+                                l2_assoc=l2_assoc,
+                                l3_sets=blis_model.cache_sets(l3_size, l3_assoc),
+                                l3_assoc=l3_assoc)
+    assert model["valid"].all()
+    for i,point in enumerate(points):
+        expected = scalar_blocking(*point, l2_size, l2_assoc, l3_size, l3_assoc)
+        assert {k : int(model[k][i]) for k in expected} == expected, point
+    # Scalars work, too
+    scalar = blis_model.blocking(4, 3, 256, l1_sets=64, l1_assoc=4)
+    assert int(scalar["kc"]) == scalar_blocking(4, 3, 256, 16*1024, 4, l2_size, l2_assoc,
+                                                l3_size, l3_assoc)["kc"]
@@ -0,0 +1,122 @@
+import json
+import os
+import sys
+
+import numpy
+import pandas
+
+from analysis import build_dataset
+from analysis.data_extraction import build_df, dataset_catalog, dataset_constants, read_catalog
+from sweep.stat_store import (meta_columns, stored_params, append_stat_store,
+                              compact_stat_store, create_stat_store)
+
+
+fma = "system.cpu.commitStats0.committedInstType::SimdFloatMultAcc"
+fmul = "system.cpu.commitStats0.committedInstType::SimdFloatMult"
+cycles = "system.cpu.numCycles"
+
+def write_store(path, simd_width, simd_lat, extra=False):
+    # Rows of mr 1-3 with two runs each, compacted like a finished sweep:
+    # fmul and the never sampled stat are constant, extra is only in
+    # some stat files
+    param_columns = stored_params+meta_columns
+    value_columns = [fma, fmul, cycles, "never"]+(["extra"] if extra else [])
+    schema = {"key" : "test",
+              "columns" : param_columns+value_columns+["lat::bucket0", "lat::bucket1"],
+              "dtypes" : ["int64"]*len(param_columns)+["float64"]*len(value_columns)+["uint32"]*2,
+              "value_count" : len(param_columns)+len(value_columns),
+              "dists" : [["lat", 2]]}
+    index = {c : i for i,c in enumerate(schema["columns"])}
+    records = numpy.zeros((len(schema["columns"]), 6))
+    records[index["mr"]] = numpy.repeat([1, 2, 3], 2)
+    records[index["run"]] = [0, 1]*3
+    records[index["simd_width"]] = simd_width
+    records[index["simd_count"]] = 1
+    records[index["simd_lat"]] = simd_lat
+    records[index["measurements"]] = 2
+    records[index[fma]] = 100*records[index["mr"]]
+    records[index[cycles]] = 200+simd_width+records[index["run"]]
+    records[index["never"]] = numpy.nan
+    if extra:
+        records[index["extra"]] = records[index["mr"]]+0.5
+    records[index["lat::bucket0"]] = records[index["mr"]]
+    records[index["lat::bucket1"]] = simd_lat
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    create_stat_store(path, schema)
+    append_stat_store(path, schema, records)
+    compact_stat_store(path)
+
+def convert(monkeypatch, basedir, output, *args):
+    monkeypatch.setattr(sys, "argv", ["build_dataset.py",
+                                      "--basedir", str(basedir),
+                                      "--output", str(output), *args])
+    build_dataset.main()
+
+def sorted_frame(df):
+    return df.sort_values(["simd_width","mr","run"]).reset_index(drop=True)
+
+def test_dataset_matches_stat_files(tmp_path, monkeypatch, capsys):
+    basedir = tmp_path/"campaign"
+    output = tmp_path/"dataset"
+    write_store(str(basedir/"simd_width=128"/"statfile_dp0_0.h5"), 128, 4)
+    write_store(str(basedir/"simd_width=256"/"statfile_dp0_0.h5"), 256, 4, extra=True)
+    convert(monkeypatch, basedir, output)
+
+    with open(output/dataset_constants) as constants_file:
+        constants = json.load(constants_file)
+    assert constants[fmul] == [0.0, "float64"]
+    assert numpy.isnan(constants["never"][0])
+
+    targets = [cycles, "lat::bucket0", "lat::bucket1", "efficiency"]
+    for select_stats in [{}, {"simd_width" : 256, "mr" : 2}, {"simd_width" : 512}]:
+        for target_stats in [targets, "all"]:
+            expected = build_df(str(basedir), select_stats, target_stats)
+            df = build_df(str(output), select_stats, target_stats)
+            if expected.empty:
+                assert df.empty
+                continue
+            assert df.attrs["constants"].keys() == expected.attrs["constants"].keys()
+            assert sorted(df.columns) == sorted(expected.columns)
+            pandas.testing.assert_frame_equal(sorted_frame(df[expected.columns]),
+                                              sorted_frame(expected),
+                                              check_dtype=False)
+
+    # The first file has no extra column, the unified schema has it
+    df = sorted_frame(build_df(str(output), {}, "all"))
+    assert df["extra"].isna().tolist() == [True]*6+[False]*6
+
+    best = build_df(str(output), {}, targets,
+                    reduction=([p for p in stored_params if "run" != p], "argmax", "efficiency"))
+    assert len(best) == 6
+    assert (best["run"] == 0).all()
+
+    # Unchanged stat files aren't converted again, a NaN constant doesn't
+    # force a rebuild
+    capsys.readouterr()
+    convert(monkeypatch, basedir, output)
+    assert "Converting 0 stat files" in capsys.readouterr().out
+
+    # A changed stat file is written to new Parquet files, the old ones are
+    # removed once the new catalog replaced the old one
+    old_paths = set(read_catalog(str(output))["path"])
+    write_store(str(basedir/"simd_width=256"/"statfile_dp0_0.h5"), 256, 6, extra=True)
+    convert(monkeypatch, basedir, output)
+    catalog = read_catalog(str(output))
+    assert len(catalog) == 2
+    assert all(os.path.exists(output/p) for p in catalog["path"])
+    removed = old_paths-set(catalog["path"])
+    assert len(removed) == 1
+    assert "simd_width=128" in (old_paths-removed).pop()
+    assert not any(os.path.exists(output/p) for p in removed)
+    df = build_df(str(output), {"simd_width" : 256}, targets)
+    assert (df["lat::bucket1"] == 6).all()
+
+    # Converting the same stat files again doesn't overwrite the files of
+    # the current catalog
+    old_paths = set(catalog["path"])
+    convert(monkeypatch, basedir, output, "--rebuild")
+    catalog = read_catalog(str(output))
+    assert len(catalog) == 2
+    assert not old_paths & set(catalog["path"])
+    assert not any(os.path.exists(output/p) for p in old_paths)
+    assert os.path.exists(output/dataset_catalog)
@@ -0,0 +1,77 @@
+import multiprocessing.sharedctypes
+
+import numpy
+import pandas
+
+from analysis.data_extraction import build_df, read_dists, expand_dists, reduce_partial
+from sweep.stat_store import (meta_columns, stored_params, append_stat_store,
+                              create_stat_store)
+
+
+def test_range_labelled_buckets(tmp_path):
+    # Written by versions before positional buckets: the first row has
+    # buckets of size 1 from 0, the second buckets of size 2 from 4
+    path = str(tmp_path/"stats.h5")
+    pandas.DataFrame({"run" : [0, 1],
+                      "lat::0" : [3, 0],
+                      "lat::1" : [1, 0],
+                      "lat::2" : [0, 0],
+                      "lat::4-5" : [0, 5],
+                      "lat::6-7" : [0, 2],
+                      "lat::min_value" : [0, 4],
+                      "lat::max_value" : [1, 7],
+                      "vec::0" : [7, 8]}).to_hdf(path, key="gem5stats")
+
+    dists = read_dists(path)
+    assert list(dists) == ["lat"]
+    numpy.testing.assert_array_equal(dists["lat"][:,:3], [[3, 1, 0], [5, 2, 0]])
+    assert not dists["lat"][:,3:].any()
+
+    selected = expand_dists(path, names=["lat"], select_stats={"run" : 1})
+    assert selected["lat::bucket0"].tolist() == [5]
+    assert selected["lat::bucket1"].tolist() == [2]
+
+
+def test_argmax_repeated_index():
+    # Older stat files repeat index labels, every row is labelled 0 here
+    df = pandas.DataFrame({"mr" : [1, 1, 2, 2],
+                           "run" : [0, 1, 0, 1],
+                           "efficiency" : [0.5, 0.7, 0.9, numpy.nan]},
+                          index=[0, 0, 0, 0])
+    best = reduce_partial(df, (["mr"], "argmax", "efficiency"))
+    assert best["mr"].tolist() == [1, 2]
+    assert best["run"].tolist() == [1, 0]
+    assert best["efficiency"].tolist() == [0.7, 0.9]
+
+
+def test_shared_frame_without_copies(tmp_path, monkeypatch):
+    param_columns = stored_params+meta_columns
+    value_columns = ["system.cpu.commitStats0.committedInstType::SimdFloatMultAcc",
+                     "system.cpu.commitStats0.committedInstType::SimdFloatMult",
+                     "system.cpu.numCycles"]
+    schema = {"key" : "test",
+              "columns" : param_columns+value_columns+["lat::bucket0"],
+              "dtypes" : ["int64"]*len(param_columns)+["float64"]*3+["uint32"],
+              "value_count" : len(param_columns)+len(value_columns),
+              "dists" : [["lat", 1]]}
+    records = numpy.ones((len(schema["columns"]), 4))
+    records[schema["columns"].index("run")] = numpy.arange(4)
+    for i in range(2):
+        path = str(tmp_path/f"stats_dp{i}_0.h5")
+        create_stat_store(path, schema)
+        append_stat_store(path, schema, records)
+
+    shared = []
+    raw_array = multiprocessing.sharedctypes.RawArray
+    def recorded_raw_array(*args):
+        raw = raw_array(*args)
+        shared.append(numpy.frombuffer(raw, dtype=numpy.uint8))
+        return raw
+    monkeypatch.setattr(multiprocessing.sharedctypes, "RawArray", recorded_raw_array)
+
+    df = build_df(str(tmp_path), {}, ["system.cpu.numCycles", "lat::bucket0", "efficiency"])
+    assert len(df) == 8
+    assert list(df.dtypes[-3:]) == ["float64", "uint32", "float64"]
+    # Every column is a view of the preallocated shared blocks
+    for column in df.columns:
+        assert any(numpy.shares_memory(df[column].to_numpy(), block) for block in shared), column
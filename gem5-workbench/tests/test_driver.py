@@ -0,0 +1,100 @@
+import importlib.util
+import os
+
+import pytest
+
+from sweep.stat_store import combo_params
+
+
+@pytest.fixture(scope="module")
+def driver():
+    # The gem5 config isn't a module, load it like gem5 would without
+    # running main()
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                        "..", "configs", "multi-isa-nanogemm.py")
+    spec = importlib.util.spec_from_file_location("multi_isa_nanogemm", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def make_combo(mr, nr, simd_width=256):
+    params = {"mr" : mr, "nr" : nr,
+              "simd_lat" : 4, "simd_count" : 2, "simd_width" : simd_width,
+              "simd_phreg_count" : 128, "ld_count" : 2, "st_count" : 1,
+              "l1_size" : 64, "iq_size" : 64, "rob_size" : 128, "assoc" : 4,
+              "decode_width" : 4, "commit_width" : 4, "fetch_buf_size" : 64}
+    return tuple(params[p] for p in combo_params)
+
+def summary(combo, cached=False, **values):
+    return {"combo" : combo, "cached" : cached,
+            "host_seconds" : None, "peak_rss" : None, **values}
+
+
+def test_cost_model(driver, tmp_path):
+    combos = [make_combo(mr, nr) for mr in range(1, 5) for nr in range(1, 5)]
+    analytic = driver.CostModel.analytic_costs(combos).tolist()
+    assert analytic == [driver.CostModel.analytic_cost(c) for c in combos]
+
+    history_path = str(tmp_path/"statfilehosttimes.csv")
+    cost_model = driver.CostModel(history_path)
+    cost_model.prime(combos)
+    assert [cost_model.estimate(c) for c in combos] == analytic
+    slow = combos[0]
+    for combo, cost in zip(combos[:4], analytic):
+        seconds = 1000.0*cost if combo == slow else 2.0*cost
+        cost_model.record(summary(combo, host_seconds=seconds))
+    # Neither cache hits nor unmeasured results are recorded
+    cost_model.record(summary(combos[4], cached=True, host_seconds=1.0))
+    cost_model.record(summary(combos[5]))
+    cost_model.history_file.close()
+
+    # Calibrated with the median ratio, recorded combinations use their
+    # own host time
+    cost_model = driver.CostModel(history_path)
+    cost_model.prime(combos)
+    assert sorted(cost_model.recorded) == sorted(combos[:4])
+    assert cost_model.seconds_per_unit == pytest.approx(2.0)
+    for combo, cost in zip(combos[1:], analytic[1:]):
+        assert cost_model.estimate(combo) == pytest.approx(2.0*cost)
+    longest_first = sorted(combos, key=cost_model.estimate, reverse=True)
+    assert longest_first[0] == slow
+    assert [cost_model.estimate(c) for c in longest_first[1:]] == \
+        sorted((2.0*cost for cost in analytic[1:]), reverse=True)
+    cost_model.history_file.close()
+
+def test_memory_admission(driver, tmp_path):
+    small = make_combo(2, 2, simd_width=128)
+    large = make_combo(2, 2, simd_width=512)
+    assert driver.MemoryAdmission.config_class(small) != driver.MemoryAdmission.config_class(large)
+
+    history_path = str(tmp_path/"statfilememory.csv")
+    admission = driver.MemoryAdmission(history_path, budget=400,
+                                       initial_footprint=100, margin=0.5, min_free=0)
+    assert admission.footprint(small) == 150
+    assert admission.admit(small, 0)
+    assert admission.admit(small, 1)
+    assert not admission.admit(small, 2)
+    assert admission.reserved() == 300
+
+    admission.release(0, summary(small, peak_rss=200))
+    # A cache hit says nothing about the class
+    admission.release(1, summary(large, cached=True, peak_rss=1000))
+    assert admission.reserved() == 0
+    assert admission.footprint(small) == 300
+    # Unknown classes are assumed to be as large as the largest known one
+    assert admission.footprint(large) == 300
+
+    # A single simulation is admitted even if it exceeds the budget
+    assert admission.admit(large, 3)
+    admission.release(3, summary(large, peak_rss=1000))
+    assert admission.admit(large, 4)
+    assert not admission.admit(small, 5)
+    admission.release(4, summary(large))
+    admission.history_file.close()
+
+    admission = driver.MemoryAdmission(history_path, budget=400,
+                                       initial_footprint=100, margin=0.5, min_free=0)
+    assert admission.peak_rss == {driver.MemoryAdmission.config_class(small) : 200,
+                                  driver.MemoryAdmission.config_class(large) : 1000}
+    assert admission.footprint(large) == 1500
+    admission.history_file.close()
@@ -0,0 +1,135 @@
+import csv
+import os
+import time
+
+from sweep.schedulers import FrontierSearch, LeaseScheduler, PruningScheduler, dominates
+from sweep.stat_store import combo_params
+
+
+def make_combo(mr, nr=1, simd_lat=0):
+    return (mr, nr, simd_lat)+(0,)*(len(combo_params)-3)
+
+def summary(combo, efficiency=None):
+    return {"combo" : combo, "efficiency" : efficiency}
+
+def grid():
+    # Two groups of non-axis parameters, monotone efficiency in mr and nr
+    return [make_combo(mr, nr, lat) for lat in [2, 4] for mr in range(1, 7) for nr in range(1, 5)]
+
+def efficiency(combo):
+    mr, nr, lat = combo[:3]
+    return min(1.0, mr*nr/(4.0*lat))
+
+def run_sweep(scheduler, inflight=3):
+    # Like dispatch_simulations: keep up to inflight combinations running,
+    # finish the oldest one when nothing else can be submitted
+    running = []
+    simulated = []
+    skipped = []
+    while True:
+        while len(running) < inflight and (combo := scheduler.next_combo()) is not None:
+            running.append(combo)
+        skipped.extend(scheduler.pop_skipped())
+        if not running:
+            break
+        combo = running.pop(0)
+        simulated.append(combo)
+        scheduler.add_result(summary(combo, efficiency(combo)))
+    skipped.extend(scheduler.pop_skipped())
+    return simulated, skipped
+
+def test_frontier_search(tmp_path):
+    axes_idx = [combo_params.index("mr"), combo_params.index("nr")]
+    combos = grid()
+    scheduler = FrontierSearch(combos, ["mr","nr"], 0.75)
+    simulated, _ = run_sweep(scheduler)
+    assert len(simulated) < len(combos)
+
+    passing = [c for c in combos if efficiency(c) >= 0.75]
+    expected = [c for c in passing
+                if not any(o != c and o[2:] == c[2:] and dominates(c, o, axes_idx)
+                           for o in passing)]
+    frontier = scheduler.frontier()
+    assert sorted(c for c,_ in frontier) == sorted(expected)
+    for combo, e in frontier:
+        assert e is None or e == efficiency(combo)
+
+def test_pruning_scheduler(tmp_path):
+    combos = grid()
+    pruned_path = tmp_path/"pruned.csv"
+    scheduler = PruningScheduler(combos, ["mr","nr"], 1.0, 0.25,
+                                 str(pruned_path), window=4)
+    simulated, skipped = run_sweep(scheduler)
+    assert skipped
+    assert sorted(simulated+skipped) == sorted(combos)
+
+    with open(pruned_path, newline='') as pruned_file:
+        rows = list(csv.DictReader(pruned_file))
+    assert len(rows) == len(skipped)
+    for row in rows:
+        combo = tuple(int(row[p]) for p in combo_params)
+        assert combo in skipped
+        if "saturated" == row["status"]:
+            assert efficiency(combo) >= 1.0
+        else:
+            assert "hopeless" == row["status"]
+            assert efficiency(combo) < 0.25
+
+def lease_node(work_dir, batches, node_rank, owner):
+    # Nodes of a campaign run in different processes, here they only
+    # differ by their owner name
+    scheduler = LeaseScheduler(str(work_dir), "test", batches,
+                               node_rank=node_rank, node_count=2,
+                               lease_timeout=60.0,
+                               selected={c for batch in batches for c in batch})
+    scheduler.owner = owner
+    return scheduler
+
+def test_lease_nodes_cover_campaign(tmp_path):
+    batches = [[make_combo(2*i+1), make_combo(2*i+2)] for i in range(4)]
+    nodes = [lease_node(tmp_path, batches, rank, f"node{rank}") for rank in range(2)]
+    simulated = [[], []]
+    active = [True, True]
+    while any(active):
+        for rank,node in enumerate(nodes):
+            combo = node.next_combo() if active[rank] else None
+            if combo is None:
+                active[rank] = False
+                continue
+            simulated[rank].append(combo)
+            node.add_result(summary(combo))
+
+    assert not set(simulated[0]) & set(simulated[1])
+    assert sorted(simulated[0]+simulated[1]) == sorted(c for batch in batches for c in batch)
+    # Every node started with its own slice
+    assert simulated[0][0] == make_combo(1)
+    assert simulated[1][0] == make_combo(3)
+    assert all(node.exhausted() for node in nodes)
+    assert len(os.listdir(tmp_path/"campaign"/"done")) == 4
+
+def test_lease_takeover(tmp_path):
+    batches = [[make_combo(1), make_combo(2)], [make_combo(3)]]
+    crashed = lease_node(tmp_path, batches, 0, "crashed")
+    assert crashed.next_combo() == make_combo(1)
+    survivor = lease_node(tmp_path, batches, 1, "survivor")
+    combo = survivor.next_combo()
+    assert combo == make_combo(3)
+    survivor.add_result(summary(combo))
+
+    # The lease of the crashed node hasn't expired yet, the survivor
+    # waits for it instead of ending the sweep
+    assert survivor.next_combo() is None
+    assert not survivor.exhausted()
+
+    lease_dir = tmp_path/"campaign"/"leases"
+    [lease] = os.listdir(lease_dir)
+    expired = time.time()-120
+    os.utime(lease_dir/lease, (expired, expired))
+    taken_over = []
+    while (combo := survivor.next_combo()) is not None:
+        taken_over.append(combo)
+        survivor.add_result(summary(combo))
+    assert taken_over == [make_combo(1), make_combo(2)]
+    assert survivor.exhausted()
+    assert sorted(os.listdir(tmp_path/"campaign"/"done")) == \
+        [LeaseScheduler.batch_name(0), LeaseScheduler.batch_name(1)]
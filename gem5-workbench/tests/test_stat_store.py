@@ -0,0 +1,83 @@
+import os
+
+import numpy
+import pandas
+
+from analysis.data_extraction import read_constants, read_dists, read_statfile
+from sweep.stat_store import (combo_params, meta_columns, stored_params,
+                              append_completed_index, append_stat_store,
+                              compact_stat_store, completed_index_path,
+                              create_stat_store, load_completed_combos)
+
+
+def make_schema():
+    param_columns = stored_params+meta_columns
+    value_columns = ["cycles", "constant"]
+    return {"key" : "test",
+            "columns" : param_columns+value_columns+["lat::bucket0", "lat::bucket1"],
+            "dtypes" : ["int64"]*len(param_columns)+["float64"]*2+["uint32"]*2,
+            "value_count" : len(param_columns)+len(value_columns),
+            "dists" : [["lat", 2]]}
+
+def make_records(schema, first_mr, row_count):
+    # (column x row) like the buffers of process_results
+    records = numpy.zeros((len(schema["columns"]), row_count))
+    index = {c : i for i,c in enumerate(schema["columns"])}
+    records[index["mr"]] = numpy.arange(first_mr, first_mr+row_count)
+    records[index["run"]] = numpy.arange(row_count)%2
+    records[index["measurements"]] = 2
+    records[index["cycles"]] = 100.0+records[index["mr"]]
+    records[index["constant"]] = 7.0
+    records[index["lat::bucket0"]] = records[index["mr"]]
+    records[index["lat::bucket1"]] = 1
+    return records
+
+
+def test_store_round_trip(tmp_path):
+    path = str(tmp_path/"statfile_dp0_0.h5")
+    schema = make_schema()
+    first = make_records(schema, 1, 3)
+    second = make_records(schema, 4, 2)
+    create_stat_store(path, schema)
+    append_stat_store(path, schema, first)
+    append_stat_store(path, schema, second)
+    records = numpy.concatenate([first, second], axis=1)
+    value_columns = schema["columns"][:schema["value_count"]]
+
+    df = read_statfile(path)
+    assert list(df.columns) == value_columns
+    assert (df[stored_params+meta_columns].dtypes == "int64").all()
+    numpy.testing.assert_array_equal(df.to_numpy(), records[:schema["value_count"]].T)
+    dists = read_dists(path)
+    assert dists["lat"].dtype == numpy.uint32
+    numpy.testing.assert_array_equal(dists["lat"], records[schema["value_count"]:].T)
+
+    selected = read_statfile(path, select_stats={"mr" : 4}, columns=["mr", "cycles"])
+    assert selected.to_dict("list") == {"mr" : [4], "cycles" : [104.0]}
+
+    compact_stat_store(path)
+    assert read_constants(path) == {"constant" : (7.0, "float64")}
+    compacted = read_statfile(path)
+    pandas.testing.assert_frame_equal(compacted[value_columns], df)
+    assert "constant" not in read_statfile(path, skip_constants={"constant"})
+    # The indexed params table is kept
+    selected = read_statfile(path, select_stats={"mr" : 5, "run" : 1}, columns=["cycles"])
+    assert selected["cycles"].tolist() == [105.0]
+    numpy.testing.assert_array_equal(read_dists(path, select_stats={"mr" : 5})["lat"], [[5, 1]])
+
+def test_completed_index(tmp_path):
+    schema = make_schema()
+    path = os.path.join(tmp_path, "simd_width=128", "statfile_dp0_0.h5")
+    os.makedirs(os.path.dirname(path))
+    records = make_records(schema, 1, 3)
+    create_stat_store(path, schema)
+    append_stat_store(path, schema, records)
+    combo_idx = [schema["columns"].index(p) for p in combo_params]
+    append_completed_index(path, records[combo_idx])
+
+    expected = {tuple(int(v) for v in combo) for combo in records[combo_idx].T}
+    assert load_completed_combos(str(tmp_path), "statfile") == expected
+    # A lost index is recreated from the stat file
+    os.remove(completed_index_path(path))
+    assert load_completed_combos(str(tmp_path), "statfile") == expected
+    assert os.path.exists(completed_index_path(path))